@@ -1,9 +1,13 @@
 import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import streamlit as st
 
+from cws_charts import figure_png, plot_cum_net, plot_daily, plot_top_countries
+from cws_cube import DailyCube
+from cws_report import compute_kpis, load_store_cube
+from cws_store import STORE_DIR, has_store, read_cws_csv, store_date_bounds, store_fingerprint
+
 
 
 # ----------------------------
@@ -15,117 +19,73 @@ INST_TOTAL_FILENAME = "Installazioni_gcehdljihahllhbbngifpbkmghllfjio.csv"
 UNINST_TOTAL_FILENAME = "Disinstallazioni_gcehdljihahllhbbngifpbkmghllfjio.csv"
 INST_BY_REGION_FILENAME = "Installazioni per regione_gcehdljihahllhbbngifpbkmghllfjio.csv"
 UNINST_BY_REGION_FILENAME = "Disinstallazioni per regione_gcehdljihahllhbbngifpbkmghllfjio.csv"
-UNKNOWN_REGION_NAME = "Unknown"
+
+# Versioni dei report tenute in cache (CSV parsati + frame derivati); le più vecchie vengono scartate
+CACHE_MAX_ENTRIES = 8
+# Grafici renderizzati (PNG) tenuti in cache: combinazioni di dati, paese, metrica e top N
+CHART_CACHE_MAX_ENTRIES = 64
 
 
 
 # ----------------------------
 # Helpers
 # ----------------------------
-def read_cws_csv(path: str) -> pd.DataFrame:
+def file_key(path: str) -> tuple:
     """
-    I CSV del Chrome Web Store spesso hanno una prima riga "titolo" / metadata.
-    Nel tuo caso funzionava con skiprows=1.
+    Identità del file per la cache: (path, size, mtime_ns).
+    Se il CSV viene sostituito con un nuovo export la chiave cambia e i dati vengono riletti.
     """
-    df = pd.read_csv(path, skiprows=1)
-
-    # Normalizza colonna data
-    if "Data" not in df.columns:
-        raise ValueError(f"Colonna 'Data' non trovata in {path}. Colonne: {list(df.columns)}")
-
-    df["Data"] = pd.to_datetime(df["Data"], format="%d/%m/%y", dayfirst=True, errors="coerce")
-    if df["Data"].isna().any():
-        raise ValueError("Alcune date non sono state parse correttamente. Controlla il formato nel CSV.")
-
-    # Assicura che le colonne numeriche siano numeriche
-    for c in df.columns:
-        if c == "Data":
-            continue
-        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0)
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
 
-    return df
 
 
+@st.cache_data(max_entries=4 * CACHE_MAX_ENTRIES, show_spinner=False)
+def load_cws_csv(key: tuple) -> pd.DataFrame:
+    return read_cws_csv(key[0])
 
-def to_long(df: pd.DataFrame, value_name: str) -> pd.DataFrame:
-    value_cols = [c for c in df.columns if c != "Data"]
-    return df.melt(id_vars=["Data"], value_vars=value_cols, var_name="Paese", value_name=value_name)
-
-
-
-def compute_region_summary(inst_long: pd.DataFrame, uninst_long: pd.DataFrame) -> pd.DataFrame:
-    inst_tot = inst_long.groupby("Paese", as_index=False)["Installazioni"].sum()
-    uninst_tot = uninst_long.groupby("Paese", as_index=False)["Disinstallazioni"].sum()
-
-    out = inst_tot.merge(uninst_tot, on="Paese", how="outer").fillna(0)
-    out["Installazioni_nette"] = out["Installazioni"] - out["Disinstallazioni"]
-    out["Tasso_disinstallazione"] = np.where(
-        out["Installazioni"] > 0,
-        out["Disinstallazioni"] / out["Installazioni"],
-        np.nan
-    )
-
-    out = out.sort_values(["Installazioni", "Installazioni_nette"], ascending=[False, False]).reset_index(drop=True)
-    return out
-
-
-
-def compute_daily(inst_long: pd.DataFrame, uninst_long: pd.DataFrame) -> pd.DataFrame:
-    daily_i = inst_long.groupby("Data", as_index=False)["Installazioni"].sum()
-    daily_u = uninst_long.groupby("Data", as_index=False)["Disinstallazioni"].sum()
-
-    daily = daily_i.merge(daily_u, on="Data", how="outer").fillna(0).sort_values("Data")
-    daily["Net"] = daily["Installazioni"] - daily["Disinstallazioni"]
-    daily["Net_cumulato"] = daily["Net"].cumsum()
-    return daily
 
 
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner="Elaborazione report...")
+def load_report(inst_key: tuple, uninst_key: tuple, inst_total_key: tuple, uninst_total_key: tuple):
+    """
+    Lettura dei 4 CSV -> cubo data × paese (con riconciliazione "Unknown").
+    Memoizzato per chiave dei file (vedi file_key): i rerun causati dai widget non rifanno il parsing.
+    """
+    inst_df = load_cws_csv(inst_key)
+    uninst_df = load_cws_csv(uninst_key)
 
-def plot_daily(daily: pd.DataFrame):
-    fig, ax = plt.subplots(figsize=(12, 4.5))
-    ax.plot(daily["Data"], daily["Installazioni"], label="Installazioni")
-    ax.plot(daily["Data"], daily["Disinstallazioni"], label="Disinstallazioni")
-    ax.set_title("Andamento giornaliero: installazioni vs disinstallazioni", fontsize=14)
-    ax.set_xlabel("Data", fontsize=12)
-    ax.set_ylabel("Conteggio", fontsize=12)
-    ax.tick_params(axis="both", labelsize=11)
-    ax.legend(fontsize=11)
-    fig.autofmt_xdate()
-    fig.tight_layout()
-    return fig
+    inst_total_df = load_cws_csv(inst_total_key)
+    uninst_total_df = load_cws_csv(uninst_total_key)
+    return DailyCube.from_wide(inst_df, uninst_df, inst_total_df, uninst_total_df)
 
 
 
-def plot_cum_net(daily: pd.DataFrame):
-    fig, ax = plt.subplots(figsize=(12, 4.5))
-    ax.plot(daily["Data"], daily["Net_cumulato"])
-    ax.set_title("Crescita netta cumulata (installazioni - disinstallazioni)", fontsize=14)
-    ax.set_xlabel("Data", fontsize=12)
-    ax.set_ylabel("Net cumulato", fontsize=12)
-    ax.tick_params(axis="both", labelsize=11)
-    fig.autofmt_xdate()
-    fig.tight_layout()
-    return fig
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner="Lettura store...")
+def load_store_report(fingerprint: tuple, start, end):
+    """
+    Come load_report ma dallo store Parquet (vedi cws_store.py): legge solo le colonne
+    e le partizioni mensili dell'intervallo [start, end].
+    """
+    return load_store_cube(STORE_DIR, start, end)
 
 
 
-def plot_top_countries(summary: pd.DataFrame, metric: str, top_n: int = 25):
+@st.cache_data(max_entries=CHART_CACHE_MAX_ENTRIES, show_spinner=False)
+def render_chart(data_key: tuple, chart: str, country: str = None, metric: str = None, top_n: int = None,
+                 _cube: DailyCube = None) -> bytes:
     """
-    metric: "Installazioni", "Disinstallazioni", "Installazioni_nette"
+    Grafico renderizzato come PNG, memoizzato per (dati, grafico, paese, metrica, top N):
+    un rerun ridisegna solo i grafici i cui input sono cambiati. _cube è escluso dalla chiave
+    (lo identifica già data_key).
     """
-    df = summary.head(top_n).copy()
-
-    fig, ax = plt.subplots(figsize=(12, 5))
-    ax.bar(df["Paese"], df[metric], width=0.6)  # barre più strette -> più spazio tra colonne
-    ax.set_title(f"Top {top_n} paesi per {metric}", fontsize=14)
-    ax.set_xlabel("Paese", fontsize=12)
-    ax.set_ylabel(metric, fontsize=12)
-    ax.tick_params(axis="both", labelsize=11)
-    ax.tick_params(axis="x", rotation=55)
-    for label in ax.get_xticklabels():
-        label.set_horizontalalignment("right")
-    fig.tight_layout()
-    return fig
+    if chart == "daily":
+        fig = plot_daily(_cube.daily(country))
+    elif chart == "cum_net":
+        fig = plot_cum_net(_cube.daily(country))
+    else:
+        fig = plot_top_countries(_cube.top(metric, top_n), metric, top_n=top_n)
+    return figure_png(fig)
 
 
 
@@ -151,85 +111,57 @@ st.markdown(
 
 st.title("Movie Time - Analisi Installazioni / Disinstallazioni")
 
+use_store = has_store(STORE_DIR)
+store_empty = False
+if use_store:
+    min_date, max_date = store_date_bounds(STORE_DIR)
+    # store con manifest ma senza mesi per regione: si usano i CSV in data/
+    store_empty = min_date is None
+    use_store = not store_empty
+
 with st.sidebar:
-    st.header("Input CSV (auto da cartella data/)")
-    st.caption(f"DATA_DIR: {DATA_DIR}")
-    st.caption(f"- {INST_BY_REGION_FILENAME}")
-    st.caption(f"- {UNINST_BY_REGION_FILENAME}")
-    st.caption(f"- {INST_TOTAL_FILENAME}")
-    st.caption(f"- {UNINST_TOTAL_FILENAME}")
+    if use_store:
+        st.header("Input: store Parquet")
+        st.caption(f"STORE_DIR: {STORE_DIR}")
+        st.caption("Aggiornalo con: python cws_store.py <cartella export>")
+        date_range = st.date_input(
+            "Periodo", value=(min_date.date(), max_date.date()), min_value=min_date.date(), max_value=max_date.date()
+        )
+    else:
+        st.header("Input CSV (auto da cartella data/)")
+        if store_empty:
+            st.warning(f"Lo store in {STORE_DIR} non contiene installazioni per regione: uso i CSV.")
+        st.caption(f"DATA_DIR: {DATA_DIR}")
+        st.caption(f"- {INST_BY_REGION_FILENAME}")
+        st.caption(f"- {UNINST_BY_REGION_FILENAME}")
+        st.caption(f"- {INST_TOTAL_FILENAME}")
+        st.caption(f"- {UNINST_TOTAL_FILENAME}")
 
     st.divider()
     top_n = st.slider("Top N paesi nei grafici a barre", min_value=5, max_value=50, value=25, step=1)
 
-# Leggi i file dalla cartella data
-inst_path = os.path.join(DATA_DIR, INST_BY_REGION_FILENAME)
-uninst_path = os.path.join(DATA_DIR, UNINST_BY_REGION_FILENAME)
-inst_total_path = os.path.join(DATA_DIR, INST_TOTAL_FILENAME)
-uninst_total_path = os.path.join(DATA_DIR, UNINST_TOTAL_FILENAME)
-
-inst_df = read_cws_csv(inst_path)
-uninst_df = read_cws_csv(uninst_path)
-
-inst_total_df = read_cws_csv(inst_total_path)
-uninst_total_df = read_cws_csv(uninst_total_path)
-
-inst_long = to_long(inst_df, "Installazioni")
-uninst_long = to_long(uninst_df, "Disinstallazioni")
-
-# Se totali != somma regioni, crea "Unknown" (a livello giornaliero)
-total_daily_inst = (
-    inst_total_df.assign(_total=inst_total_df.drop(columns=["Data"]).sum(axis=1))[["Data", "_total"]]
-    .rename(columns={"_total": "Installazioni"})
-)
-total_daily_uninst = (
-    uninst_total_df.assign(_total=uninst_total_df.drop(columns=["Data"]).sum(axis=1))[["Data", "_total"]]
-    .rename(columns={"_total": "Disinstallazioni"})
-)
-
-regional_daily_inst = inst_long.groupby("Data", as_index=False)["Installazioni"].sum()
-regional_daily_uninst = uninst_long.groupby("Data", as_index=False)["Disinstallazioni"].sum()
-
-chk = (
-    total_daily_inst.merge(regional_daily_inst, on="Data", how="outer", suffixes=("_totale", "_regioni"))
-    .merge(total_daily_uninst, on="Data", how="outer")
-    .merge(regional_daily_uninst, on="Data", how="outer", suffixes=("_totale", "_regioni"))
-    .fillna(0)
-)
-
-diff_inst = chk["Installazioni_totale"] - chk["Installazioni_regioni"]
-diff_uninst = chk["Disinstallazioni_totale"] - chk["Disinstallazioni_regioni"]
-
-# Evita negativi (nel caso raro in cui le regioni sommino più del totale)
-diff_inst = diff_inst.clip(lower=0)
-diff_uninst = diff_uninst.clip(lower=0)
-
-if (diff_inst != 0).any():
-    inst_long = pd.concat(
-        [
-            inst_long,
-            pd.DataFrame({"Data": chk["Data"], "Paese": UNKNOWN_REGION_NAME, "Installazioni": diff_inst}),
-        ],
-        ignore_index=True,
-    )
-
-if (diff_uninst != 0).any():
-    uninst_long = pd.concat(
-        [
-            uninst_long,
-            pd.DataFrame({"Data": chk["Data"], "Paese": UNKNOWN_REGION_NAME, "Disinstallazioni": diff_uninst}),
-        ],
-        ignore_index=True,
-    )
+if use_store:
+    # durante la selezione dell'intervallo date_input ritorna una sola data
+    start, end = (date_range[0], date_range[-1]) if date_range else (min_date, max_date)
+    data_key = (store_fingerprint(STORE_DIR), pd.Timestamp(start), pd.Timestamp(end))
+    cube = load_store_report(*data_key)
+else:
+    # Leggi i file dalla cartella data
+    inst_path = os.path.join(DATA_DIR, INST_BY_REGION_FILENAME)
+    uninst_path = os.path.join(DATA_DIR, UNINST_BY_REGION_FILENAME)
+    inst_total_path = os.path.join(DATA_DIR, INST_TOTAL_FILENAME)
+    uninst_total_path = os.path.join(DATA_DIR, UNINST_TOTAL_FILENAME)
 
-summary = compute_region_summary(inst_long, uninst_long)
-daily = compute_daily(inst_long, uninst_long)
+    data_key = (file_key(inst_path), file_key(uninst_path), file_key(inst_total_path), file_key(uninst_total_path))
+    cube = load_report(*data_key)
+summary = cube.summary()
 
 # KPI in alto
-total_inst = float(summary["Installazioni"].sum())
-total_uninst = float(summary["Disinstallazioni"].sum())
-total_net = float(summary["Installazioni_nette"].sum())
-uninst_rate = (total_uninst / total_inst) if total_inst > 0 else np.nan
+kpis = compute_kpis(summary)
+total_inst = kpis["installazioni"]
+total_uninst = kpis["disinstallazioni"]
+total_net = kpis["installazioni_nette"]
+uninst_rate = kpis["tasso_disinstallazione"] if kpis["tasso_disinstallazione"] is not None else np.nan
 
 c1, c2, c3, c4 = st.columns(4)
 c1.metric("Installazioni totali", f"{int(total_inst)}")
@@ -244,13 +176,11 @@ countries = ["(Tutti)"] + summary["Paese"].tolist()
 selected = st.selectbox("Filtra per paese (opzionale)", options=countries, index=0)
 
 if selected != "(Tutti)":
-    inst_long_f = inst_long[inst_long["Paese"] == selected].copy()
-    uninst_long_f = uninst_long[uninst_long["Paese"] == selected].copy()
     summary_f = summary[summary["Paese"] == selected].copy()
-    daily_f = compute_daily(inst_long_f, uninst_long_f)
+    country = selected
 else:
     summary_f = summary
-    daily_f = daily
+    country = None
 
 # Tabelle + grafici
 st.subheader("Riepilogo per paese")
@@ -262,19 +192,19 @@ if "Tasso_disinstallazione" in display_summary.columns:
 st.dataframe(display_summary, use_container_width=True, height=520)
 
 st.subheader("Andamento nel tempo")
-st.pyplot(plot_daily(daily_f), clear_figure=True)
-st.pyplot(plot_cum_net(daily_f), clear_figure=True)
+st.image(render_chart(data_key, "daily", country=country, _cube=cube))
+st.image(render_chart(data_key, "cum_net", country=country, _cube=cube))
 
 st.divider()
 
 st.subheader("Top paesi (bar chart)")
 colA, colB, colC = st.columns(3)
 with colA:
-    st.pyplot(plot_top_countries(summary, "Installazioni", top_n=top_n), clear_figure=True)
+    st.image(render_chart(data_key, "top", metric="Installazioni", top_n=top_n, _cube=cube))
 with colB:
-    st.pyplot(plot_top_countries(summary, "Disinstallazioni", top_n=top_n), clear_figure=True)
+    st.image(render_chart(data_key, "top", metric="Disinstallazioni", top_n=top_n, _cube=cube))
 with colC:
-    st.pyplot(plot_top_countries(summary, "Installazioni_nette", top_n=top_n), clear_figure=True)
+    st.image(render_chart(data_key, "top", metric="Installazioni_nette", top_n=top_n, _cube=cube))
 
 st.caption(
     "Nota: 'Installazioni_nette' = installazioni nel periodo - disinstallazioni nel periodo. "
@@ -0,0 +1,66 @@
+"""
+Grafici matplotlib della dashboard installazioni/disinstallazioni.
+
+Modulo separato così che cws_report.py importi matplotlib solo quando servono i grafici.
+"""
+import io
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+
+
+def plot_daily(daily: pd.DataFrame):
+    fig, ax = plt.subplots(figsize=(12, 4.5))
+    ax.plot(daily["Data"], daily["Installazioni"], label="Installazioni")
+    ax.plot(daily["Data"], daily["Disinstallazioni"], label="Disinstallazioni")
+    ax.set_title("Andamento giornaliero: installazioni vs disinstallazioni", fontsize=14)
+    ax.set_xlabel("Data", fontsize=12)
+    ax.set_ylabel("Conteggio", fontsize=12)
+    ax.tick_params(axis="both", labelsize=11)
+    ax.legend(fontsize=11)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    return fig
+
+
+
+def plot_cum_net(daily: pd.DataFrame):
+    fig, ax = plt.subplots(figsize=(12, 4.5))
+    ax.plot(daily["Data"], daily["Net_cumulato"])
+    ax.set_title("Crescita netta cumulata (installazioni - disinstallazioni)", fontsize=14)
+    ax.set_xlabel("Data", fontsize=12)
+    ax.set_ylabel("Net cumulato", fontsize=12)
+    ax.tick_params(axis="both", labelsize=11)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    return fig
+
+
+
+def plot_top_countries(summary: pd.DataFrame, metric: str, top_n: int = 25):
+    """
+    metric: "Installazioni", "Disinstallazioni", "Installazioni_nette"
+    """
+    df = summary.head(top_n).copy()
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    ax.bar(df["Paese"], df[metric], width=0.6)  # barre più strette -> più spazio tra colonne
+    ax.set_title(f"Top {top_n} paesi per {metric}", fontsize=14)
+    ax.set_xlabel("Paese", fontsize=12)
+    ax.set_ylabel(metric, fontsize=12)
+    ax.tick_params(axis="both", labelsize=11)
+    ax.tick_params(axis="x", rotation=55)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+    fig.tight_layout()
+    return fig
+
+
+
+def figure_png(fig, dpi: int = 150) -> bytes:
+    """Renderizza la figura come PNG e la chiude."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi)
+    plt.close(fig)
+    return buf.getvalue()
@@ -0,0 +1,154 @@
+"""
+Cubo giornaliero data × paese per la dashboard installazioni/disinstallazioni.
+
+Installazioni, disinstallazioni, net e net cumulato sono array densi (n_date × n_paesi)
+allineati su un indice di date comune: filtro per paese, riepilogo per paese e
+riconciliazione "Unknown" sono operazioni vettoriali sugli array, senza melt/merge.
+"""
+import numpy as np
+import pandas as pd
+
+
+
+UNKNOWN_REGION_NAME = "Unknown"
+
+
+
+def _daily_totals(total_df: pd.DataFrame, dates: pd.DatetimeIndex) -> np.ndarray:
+    """Somma giornaliera delle colonne (non Data) di un CSV "totale", allineata a dates (0 se mancante)."""
+    totals = total_df.drop(columns=["Data"]).sum(axis=1).groupby(total_df["Data"]).sum()
+    return totals.reindex(dates, fill_value=0).to_numpy()
+
+
+
+class DailyCube:
+    def __init__(self, dates: pd.DatetimeIndex, countries: pd.Index, installs: np.ndarray, uninstalls: np.ndarray):
+        self.dates = dates
+        self.countries = countries
+        self.installs = installs
+        self.uninstalls = uninstalls
+        self.net = installs - uninstalls
+        self.cum_net = np.cumsum(self.net, axis=0, dtype=np.int64 if self.net.dtype.kind in "iu" else None)
+        self._col = {c: i for i, c in enumerate(countries)}
+
+
+    @classmethod
+    def from_wide(cls, inst_df: pd.DataFrame, uninst_df: pd.DataFrame,
+                  inst_total_df: pd.DataFrame = None, uninst_total_df: pd.DataFrame = None) -> "DailyCube":
+        """Dai CSV per regione così come esportati (Data + una colonna per paese)."""
+        inst = inst_df.groupby("Data").sum()
+        uninst = uninst_df.groupby("Data").sum()
+        dates = inst.index.union(uninst.index)
+        for total_df in (inst_total_df, uninst_total_df):
+            if total_df is not None:
+                dates = dates.union(pd.DatetimeIndex(total_df["Data"].unique()))
+        countries = inst.columns.union(uninst.columns).sort_values()
+        dtype = np.result_type(*inst.dtypes, *uninst.dtypes)
+        installs = inst.reindex(index=dates, columns=countries, fill_value=0).to_numpy(dtype=dtype)
+        uninstalls = uninst.reindex(index=dates, columns=countries, fill_value=0).to_numpy(dtype=dtype)
+        return cls._reconciled(dates, countries, installs, uninstalls, inst_total_df, uninst_total_df)
+
+
+    @classmethod
+    def from_long(cls, inst_long: pd.DataFrame, uninst_long: pd.DataFrame,
+                  inst_total_df: pd.DataFrame = None, uninst_total_df: pd.DataFrame = None) -> "DailyCube":
+        """Da frame long (Data, Paese, Installazioni / Disinstallazioni), es. letti dallo store Parquet."""
+        frames = [f for f in (inst_total_df, uninst_total_df) if f is not None]
+        dates = pd.DatetimeIndex(pd.concat([inst_long["Data"], uninst_long["Data"]] + [f["Data"] for f in frames]).unique()).sort_values()
+        countries = pd.Index(pd.concat([inst_long["Paese"].astype(str), uninst_long["Paese"].astype(str)]).unique()).sort_values()
+        dtype = np.result_type(inst_long["Installazioni"].dtype, uninst_long["Disinstallazioni"].dtype)
+
+        def dense(long: pd.DataFrame, value: str) -> np.ndarray:
+            out = np.zeros((len(dates), len(countries)), dtype=dtype)
+            rows = dates.get_indexer(long["Data"])
+            cols = countries.get_indexer(long["Paese"].astype(str))
+            np.add.at(out, (rows, cols), long[value].to_numpy())
+            return out
+
+        installs = dense(inst_long, "Installazioni")
+        uninstalls = dense(uninst_long, "Disinstallazioni")
+        return cls._reconciled(dates, countries, installs, uninstalls, inst_total_df, uninst_total_df)
+
+
+    @classmethod
+    def _reconciled(cls, dates, countries, installs, uninstalls, inst_total_df, uninst_total_df) -> "DailyCube":
+        # Se totali != somma regioni, aggiungi la colonna "Unknown" con la differenza giornaliera
+        # (clip a 0 nel caso raro in cui le regioni sommino più del totale)
+        extra = []
+        for arr, total_df in ((installs, inst_total_df), (uninstalls, uninst_total_df)):
+            if total_df is None:
+                extra.append(None)
+                continue
+            diff = np.clip(_daily_totals(total_df, dates) - arr.sum(axis=1), 0, None)
+            extra.append(diff if (diff != 0).any() else None)
+
+        if any(d is not None for d in extra):
+            if UNKNOWN_REGION_NAME in countries:
+                i = countries.get_loc(UNKNOWN_REGION_NAME)
+                for arr, diff in zip((installs, uninstalls), extra):
+                    if diff is not None:
+                        arr[:, i] += diff.astype(arr.dtype)
+            else:
+                countries = countries.append(pd.Index([UNKNOWN_REGION_NAME]))
+                dtype = np.result_type(installs.dtype, *[d.dtype for d in extra if d is not None])
+                installs, uninstalls = [
+                    np.column_stack([arr.astype(dtype, copy=False), np.zeros(len(dates), dtype=dtype) if diff is None else diff])
+                    for arr, diff in zip((installs, uninstalls), extra)
+                ]
+        return cls(dates, countries, installs, uninstalls)
+
+
+    def between(self, start=None, end=None) -> "DailyCube":
+        """Sotto-cubo delle date in [start, end] (estremi inclusi); il net cumulato riparte da start."""
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start is not None:
+            mask &= self.dates >= pd.Timestamp(start)
+        if end is not None:
+            mask &= self.dates <= pd.Timestamp(end)
+        return DailyCube(self.dates[mask], self.countries, self.installs[mask], self.uninstalls[mask])
+
+
+    def summary(self) -> pd.DataFrame:
+        """Riepilogo per paese (Installazioni, Disinstallazioni, nette, tasso), ordinato per installazioni."""
+        inst = self.installs.sum(axis=0)
+        uninst = self.uninstalls.sum(axis=0)
+        out = pd.DataFrame({
+            "Paese": self.countries.to_numpy(),
+            "Installazioni": inst,
+            "Disinstallazioni": uninst,
+            "Installazioni_nette": inst - uninst,
+        })
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["Tasso_disinstallazione"] = np.where(inst > 0, uninst / inst, np.nan)
+
+        out = out.sort_values(["Paese"]).sort_values(["Installazioni", "Installazioni_nette"], ascending=[False, False])
+        return out.reset_index(drop=True)
+
+
+    def daily(self, country: str = None) -> pd.DataFrame:
+        """Andamento giornaliero (totale o di un paese): Installazioni, Disinstallazioni, Net, Net_cumulato."""
+        if country is None:
+            inst, uninst = self.installs.sum(axis=1), self.uninstalls.sum(axis=1)
+            net = inst - uninst
+            cum = np.cumsum(net)
+        else:
+            i = self._col[country]
+            inst, uninst, net, cum = self.installs[:, i], self.uninstalls[:, i], self.net[:, i], self.cum_net[:, i]
+        return pd.DataFrame({
+            "Data": self.dates,
+            "Installazioni": inst,
+            "Disinstallazioni": uninst,
+            "Net": net,
+            "Net_cumulato": cum,
+        })
+
+
+    def top(self, metric: str, n: int) -> pd.DataFrame:
+        """I primi n paesi per totale di metric ("Installazioni", "Disinstallazioni", "Installazioni_nette")."""
+        values = {
+            "Installazioni": self.installs,
+            "Disinstallazioni": self.uninstalls,
+            "Installazioni_nette": self.net,
+        }[metric].sum(axis=0)
+        idx = np.argsort(-values, kind="stable")[:n]
+        return pd.DataFrame({"Paese": self.countries.to_numpy()[idx], metric: values[idx]})
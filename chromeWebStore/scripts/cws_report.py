@@ -0,0 +1,184 @@
+"""
+Analisi installazioni/disinstallazioni senza interfaccia (batch).
+
+Stessa logica della dashboard (riconciliazione "Unknown", riepilogo per paese, andamento
+giornaliero, KPI) applicata a una o più cartelle di report: cartelle con i 4 CSV esportati
+dal Chrome Web Store oppure store Parquet creati con cws_store.py. Le cartelle vengono
+elaborate in parallelo su più processi; per ognuna vengono scritti:
+
+    <out>/<nome>/summary.csv   riepilogo per paese
+    <out>/<nome>/daily.csv     andamento giornaliero
+    <out>/<nome>/kpi.json      totali
+    <out>/<nome>/*.png         grafici (solo con --charts)
+
+Streamlit non viene mai importato, matplotlib solo con --charts.
+
+Uso:
+    python cws_report.py export_estensione_a/ export_estensione_b/ --out reports/
+    python cws_report.py data/store --start 2025-01-01 --end 2025-06-30 --charts
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cws_cube import DailyCube
+from cws_store import find_exports, has_store, load_dataset, read_cws_csv
+
+
+
+TOP_METRICS = ["Installazioni", "Disinstallazioni", "Installazioni_nette"]
+
+
+
+# ----------------------------
+# Caricamento
+# ----------------------------
+def load_export_cube(directory: str) -> DailyCube:
+    """Cubo dai CSV esportati in directory (i totali sono opzionali: senza, niente "Unknown")."""
+    exports = find_exports(directory)
+    missing = [d for d in ("inst_region", "uninst_region") if d not in exports]
+    if missing:
+        raise FileNotFoundError(f"CSV per regione mancanti in {directory}: {', '.join(missing)}")
+
+    frames = {dataset: read_cws_csv(path) for dataset, path in exports.items()}
+    return DailyCube.from_wide(
+        frames["inst_region"], frames["uninst_region"], frames.get("inst_total"), frames.get("uninst_total")
+    )
+
+
+
+def load_store_cube(store_dir: str, start=None, end=None) -> DailyCube:
+    """Cubo dallo store Parquet, leggendo solo i mesi dell'intervallo [start, end]."""
+    inst_long = load_dataset(store_dir, "inst_region", start, end)
+    uninst_long = load_dataset(store_dir, "uninst_region", start, end)
+
+    inst_total_df = load_dataset(store_dir, "inst_total", start, end)
+    uninst_total_df = load_dataset(store_dir, "uninst_total", start, end)
+    return DailyCube.from_long(inst_long, uninst_long, inst_total_df, uninst_total_df)
+
+
+
+def load_cube(path: str, start=None, end=None) -> DailyCube:
+    """Store Parquet o cartella di export, a seconda di cosa contiene path."""
+    if has_store(path):
+        return load_store_cube(path, start, end)
+    cube = load_export_cube(path)
+    if start is not None or end is not None:
+        cube = cube.between(start, end)
+    return cube
+
+
+
+# ----------------------------
+# Analisi
+# ----------------------------
+def compute_kpis(summary: pd.DataFrame) -> dict:
+    total_inst = float(summary["Installazioni"].sum())
+    total_uninst = float(summary["Disinstallazioni"].sum())
+    return {
+        "installazioni": total_inst,
+        "disinstallazioni": total_uninst,
+        "installazioni_nette": float(summary["Installazioni_nette"].sum()),
+        "tasso_disinstallazione": (total_uninst / total_inst) if total_inst > 0 else None,
+    }
+
+
+
+def write_report(path: str, out_dir: str, start=None, end=None, charts: bool = False, top_n: int = 25) -> dict:
+    """Elabora un report e scrive summary.csv, daily.csv, kpi.json (e i grafici) in out_dir."""
+    cube = load_cube(path, start, end)
+    summary = cube.summary()
+    daily = cube.daily()
+    kpis = compute_kpis(summary)
+    kpis.update(
+        paesi=int(len(cube.countries)),
+        dal=str(cube.dates.min().date()) if len(cube.dates) else None,
+        al=str(cube.dates.max().date()) if len(cube.dates) else None,
+    )
+
+    os.makedirs(out_dir, exist_ok=True)
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+    daily.to_csv(os.path.join(out_dir, "daily.csv"), index=False, date_format="%Y-%m-%d")
+    with open(os.path.join(out_dir, "kpi.json"), "w") as f:
+        json.dump(kpis, f, indent=2)
+
+    if charts:
+        import matplotlib
+        matplotlib.use("Agg")
+        from cws_charts import figure_png, plot_cum_net, plot_daily, plot_top_countries
+
+        pngs = {
+            "daily.png": plot_daily(daily),
+            "cum_net.png": plot_cum_net(daily),
+        }
+        for metric in TOP_METRICS:
+            pngs[f"top_{metric}.png"] = plot_top_countries(cube.top(metric, top_n), metric, top_n=top_n)
+        for name, fig in pngs.items():
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(figure_png(fig))
+    return kpis
+
+
+
+def _output_names(paths: list) -> list:
+    """Nome della sottocartella di output per ogni input (basename, con suffisso se ripetuto)."""
+    names, seen = [], {}
+    for path in paths:
+        name = os.path.basename(os.path.normpath(path)) or "report"
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+
+def _run_one(job: tuple):
+    path, out_dir, start, end, charts, top_n = job
+    try:
+        return path, out_dir, write_report(path, out_dir, start, end, charts, top_n), None
+    except Exception as e:
+        return path, out_dir, None, f"{type(e).__name__}: {e}"
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analisi batch di export del Chrome Web Store (senza Streamlit).")
+    parser.add_argument("paths", nargs="+", help="cartelle con i CSV esportati o store Parquet (cws_store.py)")
+    parser.add_argument("--out", default="reports", help="cartella di output (default: reports/)")
+    parser.add_argument("--start", help="prima data inclusa (YYYY-MM-DD)")
+    parser.add_argument("--end", help="ultima data inclusa (YYYY-MM-DD)")
+    parser.add_argument("--charts", action="store_true", help="scrive anche i grafici PNG (richiede matplotlib)")
+    parser.add_argument("--top-n", type=int, default=25, help="paesi nei grafici a barre (default: 25)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processi in parallelo (default: CPU)")
+    args = parser.parse_args()
+
+    start = pd.Timestamp(args.start) if args.start else None
+    end = pd.Timestamp(args.end) if args.end else None
+    jobs = [
+        (path, os.path.join(args.out, name), start, end, args.charts, args.top_n)
+        for path, name in zip(args.paths, _output_names(args.paths))
+    ]
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(jobs)))) as pool:
+        for path, out_dir, kpis, error in pool.map(_run_one, jobs):
+            if error:
+                failed += 1
+                print(f"{path}: ERRORE {error}", file=sys.stderr)
+                continue
+            rate = kpis["tasso_disinstallazione"]
+            print(
+                f"{path} -> {out_dir}: installazioni {int(kpis['installazioni'])}, "
+                f"disinstallazioni {int(kpis['disinstallazioni'])}, nette {int(kpis['installazioni_nette'])}, "
+                f"tasso {f'{rate:.1%}' if rate is not None and not np.isnan(rate) else 'n/a'}"
+            )
+    sys.exit(1 if failed else 0)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Store colonnare incrementale per gli export del Chrome Web Store.
+
+Ogni export (4 CSV per periodo) viene accodato in dataset Parquet partizionati per mese:
+
+    data/store/<dataset>/month=YYYY-MM/part.parquet
+
+Le righe sono deduplicate per (Data, Paese): se due export si sovrappongono vince quello
+ingerito per ultimo. I paesi sono salvati come categoria e i conteggi come int32; ad ogni
+ingestione vengono riscritti solo i mesi toccati dal nuovo export.
+
+Uso:
+    python cws_store.py                          # ingerisce i CSV presenti in data/
+    python cws_store.py export_gen/ export_feb/  # più cartelle, in ordine
+"""
+import argparse
+import glob
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+
+# ----------------------------
+# Config
+# ----------------------------
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+STORE_DIR = os.path.join(DATA_DIR, "store")
+MANIFEST_NAME = "_manifest.json"
+
+# dataset -> (prefisso del file esportato, colonna valore, chiave di deduplica)
+DATASETS = {
+    "inst_region": ("Installazioni per regione_", "Installazioni", ["Data", "Paese"]),
+    "uninst_region": ("Disinstallazioni per regione_", "Disinstallazioni", ["Data", "Paese"]),
+    "inst_total": ("Installazioni_", "Installazioni", ["Data"]),
+    "uninst_total": ("Disinstallazioni_", "Disinstallazioni", ["Data"]),
+}
+
+
+
+# ----------------------------
+# Lettura CSV
+# ----------------------------
+def read_cws_csv(path: str) -> pd.DataFrame:
+    """
+    I CSV del Chrome Web Store spesso hanno una prima riga "titolo" / metadata.
+    Nel tuo caso funzionava con skiprows=1.
+    """
+    df = pd.read_csv(path, skiprows=1)
+
+    # Normalizza colonna data
+    if "Data" not in df.columns:
+        raise ValueError(f"Colonna 'Data' non trovata in {path}. Colonne: {list(df.columns)}")
+
+    df["Data"] = pd.to_datetime(df["Data"], format="%d/%m/%y", dayfirst=True, errors="coerce")
+    if df["Data"].isna().any():
+        raise ValueError("Alcune date non sono state parse correttamente. Controlla il formato nel CSV.")
+
+    # Assicura che le colonne numeriche siano numeriche
+    for c in df.columns:
+        if c == "Data":
+            continue
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0)
+
+    return df
+
+
+
+def find_exports(directory: str) -> dict:
+    """Trova i CSV esportati in una cartella: {dataset: path}. Con più file per dataset prende il più recente."""
+    found = {}
+    for dataset, (prefix, _, _) in DATASETS.items():
+        paths = glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(prefix)}*.csv"))
+        if paths:
+            found[dataset] = max(paths, key=os.path.getmtime)
+    return found
+
+
+
+def export_to_frame(dataset: str, path: str) -> pd.DataFrame:
+    """CSV esportato -> frame long tipizzato (Data, [Paese,] valore int32)."""
+    _, value_name, key = DATASETS[dataset]
+    df = read_cws_csv(path)
+    value_cols = [c for c in df.columns if c != "Data"]
+    if "Paese" in key:
+        out = df.melt(id_vars=["Data"], value_vars=value_cols, var_name="Paese", value_name=value_name)
+        out["Paese"] = out["Paese"].astype("category")
+    else:
+        # i totali servono solo come somma giornaliera (riconciliazione "Unknown")
+        out = pd.DataFrame({"Data": df["Data"], value_name: df[value_cols].sum(axis=1)})
+    out[value_name] = out[value_name].round().astype("int32")
+    return out
+
+
+
+# ----------------------------
+# Scrittura store
+# ----------------------------
+def _month_dir(store_dir: str, dataset: str, month: str) -> str:
+    return os.path.join(store_dir, dataset, f"month={month}")
+
+
+
+def ingest_frame(store_dir: str, dataset: str, frame: pd.DataFrame) -> list:
+    """Fonde frame nelle partizioni mensili del dataset; ritorna i mesi riscritti."""
+    key = DATASETS[dataset][2]
+    months = frame["Data"].dt.strftime("%Y-%m")
+    written = []
+    for month, part in frame.groupby(months, sort=True):
+        month_dir = _month_dir(store_dir, dataset, month)
+        path = os.path.join(month_dir, "part.parquet")
+        if os.path.exists(path):
+            existing = pd.read_parquet(path)
+            part = pd.concat([existing, part], ignore_index=True)
+        part = part.drop_duplicates(subset=key, keep="last").sort_values(key).reset_index(drop=True)
+        if "Paese" in part.columns:
+            # concat di categorie diverse torna object: ricategorizza
+            part["Paese"] = part["Paese"].astype(str).astype("category")
+
+        os.makedirs(month_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        part.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        written.append(month)
+    return written
+
+
+
+def _load_manifest(store_dir: str) -> dict:
+    try:
+        with open(os.path.join(store_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+
+def ingest_dir(directory: str, store_dir: str = STORE_DIR) -> dict:
+    """
+    Ingerisce gli export trovati in directory. I file già ingeriti (stesso path, size e mtime)
+    vengono saltati. Ritorna {dataset: mesi riscritti}.
+    """
+    manifest = _load_manifest(store_dir)
+    result = {}
+    for dataset, path in find_exports(directory).items():
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        if manifest.get(path) == [stat.st_size, stat.st_mtime_ns]:
+            continue
+        result[dataset] = ingest_frame(store_dir, dataset, export_to_frame(dataset, path))
+        manifest[path] = [stat.st_size, stat.st_mtime_ns]
+
+    if result:
+        os.makedirs(store_dir, exist_ok=True)
+        tmp = os.path.join(store_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, os.path.join(store_dir, MANIFEST_NAME))
+    return result
+
+
+
+# ----------------------------
+# Lettura store
+# ----------------------------
+def has_store(store_dir: str = STORE_DIR) -> bool:
+    return os.path.exists(os.path.join(store_dir, MANIFEST_NAME))
+
+
+
+def store_fingerprint(store_dir: str = STORE_DIR) -> tuple:
+    """Chiave di cache dello store: cambia ad ogni ingestione (il manifest viene riscritto)."""
+    stat = os.stat(os.path.join(store_dir, MANIFEST_NAME))
+    return (os.path.abspath(store_dir), stat.st_size, stat.st_mtime_ns)
+
+
+
+def store_months(store_dir: str, dataset: str) -> list:
+    dataset_dir = os.path.join(store_dir, dataset)
+    if not os.path.isdir(dataset_dir):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(dataset_dir) if name.startswith("month="))
+
+
+
+def store_date_bounds(store_dir: str = STORE_DIR, dataset: str = "inst_region"):
+    """(prima, ultima) data presente, leggendo solo la colonna Data del primo e dell'ultimo mese."""
+    months = store_months(store_dir, dataset)
+    if not months:
+        return None, None
+    first = pd.read_parquet(os.path.join(_month_dir(store_dir, dataset, months[0]), "part.parquet"), columns=["Data"])
+    last = pd.read_parquet(os.path.join(_month_dir(store_dir, dataset, months[-1]), "part.parquet"), columns=["Data"])
+    return first["Data"].min(), last["Data"].max()
+
+
+
+def load_dataset(store_dir: str, dataset: str, start=None, end=None, columns=None) -> pd.DataFrame:
+    """
+    Legge un dataset dallo store. Con start/end vengono aperte solo le partizioni dei mesi
+    coinvolti e filtrate le righe; columns limita le colonne lette (default: tutte tranne month).
+    """
+    _, value_name, key = DATASETS[dataset]
+    columns = columns or key + [value_name]
+    months = store_months(store_dir, dataset)
+    if start is not None:
+        months = [m for m in months if m >= pd.Timestamp(start).strftime("%Y-%m")]
+    if end is not None:
+        months = [m for m in months if m <= pd.Timestamp(end).strftime("%Y-%m")]
+    if not months:
+        return pd.DataFrame({c: pd.Series(dtype="int32" if c == value_name else "object") for c in columns})
+
+    filters = []
+    if start is not None:
+        filters.append(("Data", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("Data", "<=", pd.Timestamp(end)))
+    paths = [os.path.join(_month_dir(store_dir, dataset, m), "part.parquet") for m in months]
+    return pq.read_table(paths, columns=columns, filters=filters or None).to_pandas()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingerisce export CSV del Chrome Web Store nello store Parquet.")
+    parser.add_argument("dirs", nargs="*", default=[DATA_DIR], help="cartelle con i CSV esportati (default: data/)")
+    parser.add_argument("--store", default=STORE_DIR, help="cartella dello store (default: data/store)")
+    args = parser.parse_args()
+
+    for directory in args.dirs:
+        result = ingest_dir(directory, args.store)
+        if not result:
+            print(f"{directory}: niente di nuovo")
+        for dataset, months in result.items():
+            print(f"{directory}: {dataset} -> {len(months)} mesi aggiornati ({', '.join(months)})")
+
+
+
+if __name__ == "__main__":
+    main()
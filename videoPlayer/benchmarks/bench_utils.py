@@ -0,0 +1,32 @@
+"""Helpers shared by the benchmark scripts."""
+import importlib.util
+import json
+import logging
+import os
+
+
+DEFAULT_STREAMER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'video-streamer.py')
+
+
+def load_streamer(path=DEFAULT_STREAMER, log_level=logging.WARNING):
+    """Import video-streamer.py (hyphenated filename) as a module."""
+    spec = importlib.util.spec_from_file_location('video_streamer_bench', os.path.abspath(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # keep per-request log lines out of the measurements
+    module.logger.setLevel(log_level)
+    return module
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def write_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
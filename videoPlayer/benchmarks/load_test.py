@@ -0,0 +1,331 @@
+"""Control-plane load test: /session, /control, /select_tracks and /status under many viewers.
+
+Starts video-streamer.py in a child process (werkzeug threaded server, like app.run)
+with the stub ffmpeg/ffprobe from benchmarks/fake_bin on PATH, creates --sessions
+sessions, then runs simulated viewers at increasing concurrency levels. Each viewer
+follows a scripted behaviour model (polling, seeking, switching tracks, hosting a
+group with the batch endpoints); a share of viewers also keeps a /stream open.
+
+Per concurrency level it reports p50/p99 latency per route, request rate, errors,
+session_lock contention (from /metrics, tracing on), and the server's thread count
+and RSS.
+
+    python benchmarks/load_test.py --sessions 5000 --viewers 50,100,200,400 --step-duration 20
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from bench_utils import DEFAULT_STREAMER, load_streamer, percentile, write_results
+
+
+FAKE_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_bin')
+
+# behaviour model -> (think time seconds, {operation: weight})
+MODELS = {
+    'watcher': (1.0, {'status': 0.9, 'pause': 0.05, 'play': 0.05}),
+    'seeker': (0.5, {'status': 0.6, 'seek': 0.3, 'play': 0.1}),
+    'switcher': (0.5, {'status': 0.7, 'select_tracks': 0.2, 'tracks': 0.1}),
+    'host': (1.0, {'status_batch': 0.7, 'control_batch': 0.3}),
+}
+DEFAULT_MIX = 'watcher=0.6,seeker=0.2,switcher=0.15,host=0.05'
+HOST_GROUP_SIZE = 8
+
+
+# ----------------------------
+# Server side (child process)
+# ----------------------------
+def serve(args):
+    import logging
+
+    streamer = load_streamer(args.streamer)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    streamer.MEDIA_ROOT = args.media_dir
+    streamer.app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+def _server_process_stats(pid):
+    """(threads, rss_bytes) of the server process, from /proc (Linux) or psutil if installed."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['Threads']), int(fields['VmRSS'].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import psutil
+        proc = psutil.Process(pid)
+        return proc.num_threads(), proc.memory_info().rss
+    except Exception:
+        return None, None
+
+
+# ----------------------------
+# Client side
+# ----------------------------
+class Client:
+    """Minimal JSON client; one connection per request, as browsers hitting the dev server do."""
+
+    def __init__(self, port):
+        self.port = port
+
+    def request(self, method, path, body=None, timeout=30):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            return resp.status, data
+        finally:
+            conn.close()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (route, seconds, ok); list.append is thread-safe
+
+    def timed(self, route, fn):
+        started = time.perf_counter()
+        try:
+            status, _ = fn()
+            ok = status < 400
+        except (OSError, http.client.HTTPException):
+            ok = False
+        self.samples.append((route, time.perf_counter() - started, ok))
+
+
+def _pick(rng, weights):
+    r = rng.random() * sum(weights.values())
+    for op, w in weights.items():
+        r -= w
+        if r <= 0:
+            return op
+    return op
+
+
+def viewer(client, recorder, model, session_ids, stop, seed, media_path, duration):
+    rng = random.Random(seed)
+    think, weights = MODELS[model]
+    sid = rng.choice(session_ids)
+    group = rng.sample(session_ids, min(HOST_GROUP_SIZE, len(session_ids)))
+    # desynchronise viewers
+    stop.wait(rng.random() * think)
+    while not stop.is_set():
+        op = _pick(rng, weights)
+        if op == 'status':
+            recorder.timed('/status', lambda: client.request('GET', f'/status?session_id={sid}'))
+        elif op in ('play', 'pause'):
+            recorder.timed('/control', lambda: client.request('POST', '/control', {'session_id': sid, 'action': op}))
+        elif op == 'seek':
+            t = rng.random() * duration
+            recorder.timed('/control', lambda: client.request('POST', '/control', {'session_id': sid, 'action': 'seek', 'time': t}))
+        elif op == 'select_tracks':
+            body = {'session_id': sid, 'audio_index': rng.randint(0, 1), 'subtitle_index': rng.choice([None, 0, 1])}
+            recorder.timed('/select_tracks', lambda: client.request('POST', '/select_tracks', body))
+        elif op == 'tracks':
+            recorder.timed('/tracks', lambda: client.request('GET', '/tracks?path=' + urllib.parse.quote(media_path)))
+        elif op == 'status_batch':
+            recorder.timed('/status_batch', lambda: client.request('GET', '/status_batch?session_ids=' + ','.join(group)))
+        elif op == 'control_batch':
+            body = {'session_ids': group, 'actions': [{'action': 'seek', 'time': rng.random() * duration}, {'action': 'play'}]}
+            recorder.timed('/control_batch', lambda: client.request('POST', '/control_batch', body))
+        stop.wait(think * (0.5 + rng.random()))
+
+
+def stream_reader(port, session_id, media_path, stop):
+    """Keep a /stream open and read it, so ffmpeg restarts and pacing are exercised."""
+    query = urllib.parse.urlencode({'path': media_path, 'session_id': session_id})
+    while not stop.is_set():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            conn.request('GET', f'/stream?{query}')
+            resp = conn.getresponse()
+            while not stop.is_set() and resp.read(65536):
+                pass
+        except (OSError, http.client.HTTPException):
+            stop.wait(0.5)
+        finally:
+            conn.close()
+
+
+def _scrape_metrics(client):
+    status, data = client.request('GET', '/metrics')
+    values = {}
+    if status == 200:
+        for line in data.decode().splitlines():
+            if line and not line.startswith('#') and '{' not in line:
+                name, _, value = line.partition(' ')
+                try:
+                    values[name] = float(value)
+                except ValueError:
+                    pass
+    return values
+
+
+def run_step(port, server_pid, n_viewers, mix, session_ids, args):
+    client = Client(port)
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = []
+    models = [m for m, share in mix.items() for _ in range(round(share * n_viewers))][:n_viewers]
+    models += ['watcher'] * (n_viewers - len(models))
+    for i, model in enumerate(models):
+        threads.append(threading.Thread(target=viewer, daemon=True, args=(
+            Client(port), recorder, model, session_ids, stop, args.seed + i, args.media_path, args.media_duration)))
+    n_streams = int(n_viewers * args.stream_share)
+    for sid in session_ids[:n_streams]:
+        threads.append(threading.Thread(target=stream_reader, args=(port, sid, args.media_path, stop), daemon=True))
+
+    before = _scrape_metrics(client)
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    peak_threads, peak_rss = 0, 0
+    while time.perf_counter() - started < args.step_duration:
+        time.sleep(1.0)
+        threads_now, rss_now = _server_process_stats(server_pid)
+        peak_threads = max(peak_threads, threads_now or 0)
+        peak_rss = max(peak_rss, rss_now or 0)
+    elapsed = time.perf_counter() - started
+    after = _scrape_metrics(client)
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+
+    routes = {}
+    for route, seconds, ok in recorder.samples:
+        routes.setdefault(route, ([], [0]))
+        routes[route][0].append(seconds)
+        if not ok:
+            routes[route][1][0] += 1
+    lock_wait = after.get('videostreamer_session_lock_wait_seconds_total', 0) - before.get('videostreamer_session_lock_wait_seconds_total', 0)
+    lock_acq = after.get('videostreamer_session_lock_acquisitions_total', 0) - before.get('videostreamer_session_lock_acquisitions_total', 0)
+    return {
+        'viewers': n_viewers,
+        'streams': n_streams,
+        'requests_per_s': round(len(recorder.samples) / elapsed, 1),
+        'routes': {
+            route: {
+                'count': len(lat),
+                'errors': errors[0],
+                'p50_ms': round(percentile(lat, 50) * 1000, 2),
+                'p99_ms': round(percentile(lat, 99) * 1000, 2),
+            }
+            for route, (lat, errors) in sorted(routes.items())
+        },
+        'lock_wait_ms_total': round(lock_wait * 1000, 2),
+        'lock_wait_us_per_acquisition': round(lock_wait / lock_acq * 1e6, 2) if lock_acq else None,
+        'lock_acquisitions': int(lock_acq),
+        'ffmpeg_processes': after.get('videostreamer_ffmpeg_processes'),
+        'server_threads_peak': peak_threads or None,
+        'server_rss_mb_peak': round(peak_rss / 1e6, 1) if peak_rss else None,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(client, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # any answer means the server is up: /session exists in every streamer version
+            # (/metrics only in newer ones), and GET without an id creates nothing
+            client.request('GET', '/session', timeout=2)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def drive(args):
+    port = args.port or _free_port()
+    env = dict(os.environ)
+    env['PATH'] = FAKE_BIN + os.pathsep + env.get('PATH', '')
+    env['FAKE_MEDIA_DURATION'] = str(args.media_duration)
+    # keep background thumbnail jobs out of the measurements, and the catalog and sprite
+    # cache out of the real ones next to the script
+    state_dir = tempfile.TemporaryDirectory(prefix='movietime-load-')
+    env['THUMBNAILS_ENABLED'] = '0'
+    env['LIBRARY_DB'] = os.path.join(state_dir.name, 'library.sqlite3')
+    env['THUMBNAIL_CACHE_DIR'] = os.path.join(state_dir.name, 'thumbnails')
+    if not args.no_trace:
+        # session_lock wait totals are only collected with tracing on
+        env['STREAMER_TRACE'] = '1'
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+                               '--streamer', args.streamer, '--media-dir', args.media_dir], env=env)
+    try:
+        client = Client(port)
+        _wait_ready(client)
+        session_ids = []
+        for _ in range(args.sessions):
+            status, data = client.request('POST', '/session')
+            session_ids.append(json.loads(data)['session_id'])
+        print(f"server pid {server.pid} on port {port}, {len(session_ids)} sessions", file=sys.stderr)
+
+        mix = dict((k, float(v)) for k, v in (item.split('=') for item in args.mix.split(',')))
+        steps = []
+        for n in (int(v) for v in args.viewers.split(',')):
+            step = run_step(port, server.pid, n, mix, session_ids, args)
+            steps.append(step)
+            worst = max(step['routes'].values(), key=lambda r: r['p99_ms'], default=None)
+            print(f"viewers={n:5d} rps={step['requests_per_s']:8.1f} worst_p99={worst['p99_ms'] if worst else 'n/a'}ms "
+                  f"lock_wait/acq={step['lock_wait_us_per_acquisition']}us threads={step['server_threads_peak']} "
+                  f"rss={step['server_rss_mb_peak']}MB", file=sys.stderr)
+        return steps
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+        state_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streamer', default=DEFAULT_STREAMER, help='path to the video-streamer.py to test')
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--viewers', default='25,50,100,200', help='comma-separated concurrency levels')
+    parser.add_argument('--step-duration', type=float, default=15.0, help='seconds per concurrency level')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'behaviour model shares (models: {", ".join(MODELS)})')
+    parser.add_argument('--stream-share', type=float, default=0.05, help='share of viewers that also keep a /stream open')
+    parser.add_argument('--media-duration', type=int, default=7200, help='duration reported by the stub ffprobe')
+    parser.add_argument('--media-dir', default=os.path.join(tempfile.gettempdir(), 'movietime-load-media'))
+    parser.add_argument('--no-trace', action='store_true', help='run the server without STREAMER_TRACE (no lock stats)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.media_dir = os.path.abspath(args.media_dir)
+    os.makedirs(args.media_dir, exist_ok=True)
+    args.media_path = os.path.join(args.media_dir, 'sample.mkv')
+    if not os.path.exists(args.media_path):
+        open(args.media_path, 'wb').close()  # content is never read: ffmpeg/ffprobe are stubs
+
+    if args.serve:
+        serve(args)
+        return
+
+    steps = drive(args)
+    write_results(args.output, {'config': {k: v for k, v in vars(args).items() if k != 'serve'}, 'steps': steps})
+    print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Media-pipeline benchmark: synthetic media streamed through video-streamer.py in-process.
+
+Generates test files locally with ffmpeg lavfi sources (mkv/mp4, h264/hevc, aac/ac3,
+two audio and two subtitle tracks each; cached in --media-dir), then drives the Flask
+app through its test client and records per file:
+- /stream time-to-first-byte
+- seek-to-first-byte (seek sent via /control while streaming)
+- sustained throughput over --duration seconds of streaming
+- CPU seconds used by ffmpeg/ffprobe children per stream
+- /subtitle latency (full WebVTT response)
+
+Results are written as JSON; pass a previous run as --baseline to compare:
+
+    python benchmarks/media_bench.py --output baseline.json
+    python benchmarks/media_bench.py --baseline baseline.json --output current.json
+
+Requires ffmpeg/ffprobe in PATH (libx265 is optional: hevc files are skipped without it).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # non-POSIX platform: CPU per stream is not reported
+    resource = None
+
+from bench_utils import DEFAULT_STREAMER, load_streamer, write_results
+
+
+# name, container, video encoder, audio encoder, subtitle codec
+VARIANTS = [
+    ('h264_aac_mp4', 'mp4', 'libx264', 'aac', 'mov_text'),
+    ('h264_aac_mkv', 'mkv', 'libx264', 'aac', 'srt'),
+    ('h264_ac3_mkv', 'mkv', 'libx264', 'ac3', 'srt'),
+    ('hevc_aac_mkv', 'mkv', 'libx265', 'aac', 'ass'),
+    ('hevc_ac3_mp4', 'mp4', 'libx265', 'ac3', 'mov_text'),
+]
+
+# metric -> True when higher is better
+METRICS = {
+    'ttfb_s': False,
+    'seek_ttfb_s': False,
+    'throughput_mbps': True,
+    'cpu_s': False,
+    'subtitle_s': False,
+}
+
+
+def _write_srt(path, duration, label):
+    with open(path, 'w') as f:
+        for i, start in enumerate(range(0, int(duration), 2)):
+            f.write(f"{i + 1}\n00:{start // 60:02d}:{start % 60:02d},000 --> 00:{start // 60:02d}:{start % 60:02d},900\n")
+            f.write(f"{label} cue {i + 1}\n\n")
+
+
+def generate_media(media_dir, duration, size, fps):
+    """Create the synthetic test files (once); return {variant: path or None if the encoder is missing}."""
+    os.makedirs(media_dir, exist_ok=True)
+    srt_paths = []
+    for lang in ('eng', 'ita'):
+        srt = os.path.join(media_dir, f'subs_{lang}_{duration}.srt')
+        if not os.path.exists(srt):
+            _write_srt(srt, duration, lang)
+        srt_paths.append(srt)
+
+    files = {}
+    for name, container, vcodec, acodec, scodec in VARIANTS:
+        path = os.path.join(media_dir, f'{name}_{size}_{fps}fps_{duration}s.{container}')
+        if os.path.exists(path):
+            files[name] = path
+            continue
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}:duration={duration}',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+            '-f', 'lavfi', '-i', f'sine=frequency=660:sample_rate=48000:duration={duration}',
+            '-i', srt_paths[0], '-i', srt_paths[1],
+            '-map', '0:v', '-map', '1:a', '-map', '2:a', '-map', '3:s', '-map', '4:s',
+            '-c:v', vcodec, '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-g', str(2 * fps),
+            '-c:a', acodec, '-c:s', scodec,
+            '-metadata:s:a:0', 'language=eng', '-metadata:s:a:1', 'language=ita',
+            '-metadata:s:s:0', 'language=eng', '-metadata:s:s:1', 'language=ita',
+        ]
+        if vcodec == 'libx265' and container == 'mp4':
+            cmd += ['-tag:v', 'hvc1']
+        cmd.append(path)
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, timeout=600)
+            files[name] = path
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            stderr = getattr(e, 'stderr', b'') or b''
+            print(f"skipping {name}: generation failed ({stderr.decode(errors='ignore').strip()[:200]})", file=sys.stderr)
+            if os.path.exists(path):
+                os.remove(path)
+            files[name] = None
+    return files
+
+
+def _children_cpu():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_stream(client, path, duration, seek_points, media_duration):
+    """Stream one file; return (ttfb, [seek ttfb...], throughput MB/s, cpu seconds)."""
+    sid = client.post('/session').json['session_id']
+    client.post('/control', json={'session_id': sid, 'action': 'play'})
+
+    cpu_before = _children_cpu()
+    started = time.perf_counter()
+    resp = client.get('/stream', query_string={'path': path, 'session_id': sid}, buffered=False)
+    if resp.status_code != 200:
+        raise RuntimeError(f"/stream failed: {resp.status_code} {resp.get_data(as_text=True)[:200]}")
+    chunks = iter(resp.response)
+    try:
+        nbytes = len(next(chunks))
+        ttfb = time.perf_counter() - started
+
+        # sustained throughput: read as fast as possible for `duration` seconds
+        window_start = time.perf_counter()
+        while time.perf_counter() - window_start < duration:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            nbytes += len(chunk)
+        throughput = nbytes / (time.perf_counter() - window_start) / 1e6
+
+        seek_ttfbs = []
+        for fraction in seek_points:
+            seek_started = time.perf_counter()
+            client.post('/control', json={'session_id': sid, 'action': 'seek', 'time': fraction * media_duration})
+            if next(chunks, None) is None:
+                break
+            seek_ttfbs.append(time.perf_counter() - seek_started)
+    finally:
+        # closes the generator: ffmpeg is terminated and reaped, so its CPU shows in RUSAGE_CHILDREN
+        resp.close()
+
+    cpu = None if cpu_before is None else _children_cpu() - cpu_before
+    return ttfb, seek_ttfbs, throughput, cpu
+
+
+def bench_subtitle(client, path):
+    sid = client.post('/session').json['session_id']
+    started = time.perf_counter()
+    resp = client.get('/subtitle', query_string={'path': path, 'session_id': sid, 'idx': 0})
+    resp.get_data()
+    if resp.status_code != 200:
+        raise RuntimeError(f"/subtitle failed: {resp.status_code}")
+    return time.perf_counter() - started
+
+
+def run(args):
+    streamer = load_streamer(args.streamer)
+    # measure raw pipeline speed unless pacing is requested explicitly
+    streamer.PACING_ENABLED = args.pace
+    streamer.MEDIA_ROOT = args.media_dir
+    # fresh catalog per run: cached probes of a previous run's files would skip ffprobe,
+    # and the real library.sqlite3 next to the script is left alone
+    state_dir = tempfile.TemporaryDirectory(prefix='movietime-bench-')
+    streamer.LIBRARY_DB = os.path.join(state_dir.name, 'library.sqlite3')
+    streamer.THUMBNAIL_CACHE_DIR = os.path.join(state_dir.name, 'thumbnails')
+    streamer.THUMBNAILS_ENABLED = False
+    client = streamer.app.test_client()
+
+    try:
+        files = generate_media(args.media_dir, args.media_duration, args.size, args.fps)
+        seek_points = (0.25, 0.75, 0.1)
+        results = {}
+        for name, path in files.items():
+            if path is None:
+                results[name] = {'skipped': True}
+                continue
+            runs = {metric: [] for metric in METRICS}
+            for _ in range(args.repeat):
+                ttfb, seeks, throughput, cpu = bench_stream(client, path, args.duration, seek_points, args.media_duration)
+                runs['ttfb_s'].append(ttfb)
+                runs['seek_ttfb_s'].extend(seeks)
+                runs['throughput_mbps'].append(throughput)
+                if cpu is not None:
+                    runs['cpu_s'].append(cpu)
+                runs['subtitle_s'].append(bench_subtitle(client, path))
+            results[name] = {metric: statistics.median(values) if values else None for metric, values in runs.items()}
+            print(f"{name}: " + ', '.join(f"{k}={v:.4g}" for k, v in results[name].items() if v is not None), file=sys.stderr)
+        return results
+    finally:
+        # streamers from before the library catalog have no connection to close
+        lock = getattr(streamer, 'library_lock', None)
+        if lock is not None:
+            with lock:
+                if streamer._library_conn is not None:
+                    streamer._library_conn.close()
+                    streamer._library_conn = None
+        state_dir.cleanup()
+
+
+def _ffmpeg_version():
+    try:
+        return subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def compare(baseline, current, tolerance):
+    """Print a metric-by-metric comparison; return the number of regressions beyond tolerance."""
+    regressions = 0
+    for name, metrics in current['files'].items():
+        base = baseline.get('files', {}).get(name)
+        if not base or metrics.get('skipped') or base.get('skipped'):
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{name:14s} {metric:16s} {old:10.4g} -> {new:10.4g} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streamer', default=DEFAULT_STREAMER, help='path to the video-streamer.py to benchmark')
+    parser.add_argument('--media-dir', default=os.path.join(tempfile.gettempdir(), 'movietime-bench-media'))
+    parser.add_argument('--media-duration', type=int, default=60, help='length of the generated files (seconds)')
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of streaming for the throughput window')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--pace', action='store_true', help='keep encoder pacing on (off by default to measure raw speed)')
+    parser.add_argument('--output', default='media_bench_results.json')
+    parser.add_argument('--baseline', help='previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='relative change counted as a regression')
+    args = parser.parse_args()
+    args.media_dir = os.path.abspath(args.media_dir)
+
+    current = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'ffmpeg': _ffmpeg_version(),
+            'streamer': os.path.abspath(args.streamer),
+        },
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        'files': run(args),
+    }
+    write_results(args.output, current)
+    print(f"results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Control-plane benchmark: memory per session and /status throughput.
+
+Loads a copy of video-streamer.py in-process (no server, no ffmpeg), creates N live
+sessions and measures:
+- memory per session (tracemalloc delta / N)
+- /status requests per second through Flask's test client
+
+To compare before/after a change, run it against two versions of the streamer:
+
+    git show <old-rev>:videoPlayer/video-streamer.py > /tmp/streamer-old.py
+    python benchmarks/session_bench.py --streamer /tmp/streamer-old.py
+    python benchmarks/session_bench.py
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from bench_utils import DEFAULT_STREAMER, load_streamer
+
+
+def measure_memory(streamer, n_sessions):
+    """Return (session_ids, bytes_per_session) for n_sessions freshly created sessions."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    session_ids = [streamer._create_session() for _ in range(n_sessions)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return session_ids, (after - before) / n_sessions
+
+
+def measure_status_rps(streamer, session_ids, n_requests):
+    """Return /status requests per second over n_requests random sessions."""
+    client = streamer.app.test_client()
+    # put a share of sessions in the playing state so the computed position path is exercised
+    for sid in session_ids[::4]:
+        client.post('/control', json={'session_id': sid, 'action': 'play'})
+    picks = [random.choice(session_ids) for _ in range(n_requests)]
+    start = time.perf_counter()
+    for sid in picks:
+        resp = client.get(f'/status?session_id={sid}')
+        if resp.status_code != 200:
+            raise RuntimeError(f"/status failed for {sid}: {resp.status_code}")
+    elapsed = time.perf_counter() - start
+    return n_requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streamer', default=DEFAULT_STREAMER, help='path to the video-streamer.py to benchmark')
+    parser.add_argument('--sessions', type=int, default=10000, help='number of live sessions')
+    parser.add_argument('--requests', type=int, default=20000, help='number of /status requests')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    streamer = load_streamer(os.path.abspath(args.streamer))
+    session_ids, bytes_per_session = measure_memory(streamer, args.sessions)
+    rps = measure_status_rps(streamer, session_ids, args.requests)
+
+    print(json.dumps({
+        'streamer': os.path.abspath(args.streamer),
+        'sessions': args.sessions,
+        'bytes_per_session': round(bytes_per_session, 1),
+        'status_requests': args.requests,
+        'status_rps': round(rps, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
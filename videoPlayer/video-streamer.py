@@ -1,4 +1,4 @@
-from flask import Flask, request, Response, jsonify
+from flask import Flask, request, Response, jsonify, g, send_file
 import os
 import time
 import threading
@@ -6,9 +6,29 @@ import subprocess
 import json
 import logging
 import uuid
+import sys
+import re
+import signal
+import sqlite3
+import hashlib
+import math
+import queue
+import shutil
+import contextlib
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from functools import wraps
 
+try:
+    import fcntl
+    import resource
+    import struct
+    import termios
+except ImportError:  # non-POSIX platform: pipe buffer fill and child CPU time are not reported
+    fcntl = None
+    resource = None
+
 
 
 app = Flask(__name__)
@@ -21,11 +41,353 @@ logger = logging.getLogger(__name__)
 # Configuration: allowed directory for playback (optional security feature)
 MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.expanduser('/'))  # default to root directory
 
+# Encoder pacing: keep ffmpeg at most FFMPEG_PACE_LEAD seconds ahead of playback (0 disables),
+# resuming once the lead drops by FFMPEG_PACE_HYSTERESIS; while paused, ffmpeg is suspended
+# once its stdout pipe is full (or after FFMPEG_PAUSE_GRACE seconds where the pipe fill
+# cannot be read).
+FFMPEG_PACE_LEAD = float(os.getenv('FFMPEG_PACE_LEAD', '30'))
+FFMPEG_PACE_HYSTERESIS = float(os.getenv('FFMPEG_PACE_HYSTERESIS', '5'))
+FFMPEG_PAUSE_GRACE = float(os.getenv('FFMPEG_PAUSE_GRACE', '1'))
+PACING_ENABLED = FFMPEG_PACE_LEAD > 0 and hasattr(signal, 'SIGSTOP')
+
+
+# Metrics (Prometheus text exposition format, served on /metrics)
+metrics_lock = threading.Lock()
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class _Counter:
+    """Monotonic counter, optionally split by a single label."""
+
+    __slots__ = ('name', 'help', 'label', 'values')
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def inc(self, amount=1, label_value=None):
+        with metrics_lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with metrics_lock:
+            items = list(self.values.items())
+        for label_value, value in items:
+            labels = {self.label: label_value} if self.label else {}
+            lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+class _Histogram:
+    """Cumulative-bucket histogram, optionally split by a single label."""
+
+    __slots__ = ('name', 'help', 'label', 'buckets', 'series')
+
+    def __init__(self, name, help, label=None, buckets=_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.series = {}  # label_value -> [bucket counts..., sum, count]
+
+    def observe(self, value, label_value=None):
+        with metrics_lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with metrics_lock:
+            items = [(k, list(v)) for k, v in self.series.items()]
+        for label_value, series in items:
+            labels = {self.label: label_value} if self.label else {}
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": bound})} {count}')
+            lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": "+Inf"})} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {series[-1]}')
+        return lines
+
+
+REQUEST_LATENCY = _Histogram('videostreamer_request_duration_seconds', 'Time to produce the response (headers for /stream) per route.', label='route')
+STREAM_TTFB = _Histogram('videostreamer_stream_ttfb_seconds', 'Time from /stream request to the first bytes ffmpeg encodes.')
+SEEK_TTFB = _Histogram('videostreamer_seek_ttfb_seconds', 'Time from seek request to the first bytes the restarted ffmpeg encodes.')
+FFPROBE_DURATION = _Histogram('videostreamer_ffprobe_duration_seconds', 'ffprobe run time.')
+BYTES_STREAMED = _Counter('videostreamer_stream_bytes_total', 'Media bytes sent to clients.')
+FFMPEG_SPAWNS = _Counter('videostreamer_ffmpeg_spawns_total', 'ffmpeg processes started.', label='purpose')
+FFMPEG_RESTARTS = _Counter('videostreamer_ffmpeg_restarts_total', 'ffmpeg restarts caused by seek or track change.')
+FFMPEG_FAILURES = _Counter('videostreamer_ffmpeg_failures_total', 'ffmpeg start failures, streaming errors and non-zero exits.')
+FFMPEG_SUSPENDED = _Counter('videostreamer_ffmpeg_suspended_seconds_total',
+                            'Time streaming ffmpeg processes spent suspended while they still had encoding to do '
+                            '(not already stalled on a full pipe); wall time, a proxy for the CPU saved.')
+STREAM_MODE = _Counter('videostreamer_stream_mode_total', 'ffmpeg runs by copy (remux) vs transcode decision.', label='mode')
+_METRICS = (REQUEST_LATENCY, STREAM_TTFB, SEEK_TTFB, FFPROBE_DURATION, BYTES_STREAMED,
+            FFMPEG_SPAWNS, FFMPEG_RESTARTS, FFMPEG_FAILURES, FFMPEG_SUSPENDED, STREAM_MODE)
+
+
+class StreamStats:
+    """Live bookkeeping for one /stream response (one ffmpeg at a time)."""
+
+    __slots__ = ('session_id', 'proc', 'bytes_sent', 'restarts', 'started_at', 'first_output_at',
+                 'encoded_time', 'suspended_since', 'suspended_stalled', 'suspended_total')
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.proc = None
+        self.bytes_sent = 0
+        self.restarts = 0
+        self.started_at = time.monotonic()  # /stream request arrival
+        self.first_output_at = None  # monotonic clock when ffmpeg first had encoded bytes ready
+        self.encoded_time = None     # output seconds encoded by the current ffmpeg (from -progress)
+        self.suspended_since = None  # monotonic clock when the current ffmpeg was SIGSTOPped
+        self.suspended_stalled = False  # it was already blocked on a full pipe (no CPU saved)
+        self.suspended_total = 0.0
+
+
+live_streams = {}  # stream_id -> StreamStats (guarded by metrics_lock)
+
+
+def _pipe_fill(proc):
+    """Bytes waiting in ffmpeg's stdout pipe (encoded but not yet sent), or None if unknown."""
+    if fcntl is None or proc is None or proc.stdout is None or proc.stdout.closed:
+        return None
+    try:
+        raw = fcntl.ioctl(proc.stdout.fileno(), termios.FIONREAD, b'\0\0\0\0')
+        return struct.unpack('i', raw)[0]
+    except (OSError, ValueError):
+        return None
+
+
+def _proc_cpu_seconds(proc):
+    """CPU time (user + system) used so far by a live child process (Linux /proc only), or None."""
+    if proc is None or proc.poll() is not None:
+        return None
+    try:
+        with open(f'/proc/{proc.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime and stime are fields 14 and 15 of stat; fields[0] is field 3 (state)
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _pipe_capacity(proc):
+    """Size of ffmpeg's stdout pipe buffer in bytes (Linux only), or None if unknown."""
+    if not hasattr(fcntl, 'F_GETPIPE_SZ') or proc is None or proc.stdout is None or proc.stdout.closed:
+        return None
+    try:
+        return fcntl.fcntl(proc.stdout.fileno(), fcntl.F_GETPIPE_SZ)
+    except (OSError, ValueError):
+        return None
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - started, route)
+    return response
+
+
+# Tracing (opt-in with STREAMER_TRACE=1): named timing spans per request / stream restart
+TRACE_ENABLED = os.getenv('STREAMER_TRACE', '').lower() in ('1', 'true', 'yes')
+TRACE_SLOW_MS = float(os.getenv('STREAMER_TRACE_SLOW_MS', '100'))  # keep traces at least this slow
+slow_traces = deque(maxlen=int(os.getenv('STREAMER_TRACE_KEEP', '100')))
+_trace_local = threading.local()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Trace:
+    """Spans recorded along one request or one ffmpeg (re)start."""
+
+    __slots__ = ('name', 'started_at', 'started', 'spans', 'lock_wait', 'lock_acquisitions')
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []  # (name, offset_ms, duration_ms)
+        self.lock_wait = 0.0
+        self.lock_acquisitions = 0
+
+    def to_dict(self, total_ms):
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_ms': round(total_ms, 3),
+            'lock_wait_ms': round(self.lock_wait * 1000, 3),
+            'lock_acquisitions': self.lock_acquisitions,
+            'spans': [{'name': n, 'offset_ms': round(o, 3), 'duration_ms': round(d, 3)} for n, o, d in self.spans],
+        }
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 't0')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        self.trace.spans.append((self.name, (self.t0 - self.trace.started) * 1000, (t1 - self.t0) * 1000))
+        return False
+
+
+def _begin_trace(name):
+    """Start a trace and make it current for this thread (None when tracing is off)."""
+    if not TRACE_ENABLED:
+        return None
+    trace = _Trace(name)
+    _trace_local.trace = trace
+    return trace
+
+
+def _end_trace(trace):
+    """Finish a trace; keep it in slow_traces if it took at least TRACE_SLOW_MS."""
+    if trace is None:
+        return
+    if getattr(_trace_local, 'trace', None) is trace:
+        _trace_local.trace = None
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    if total_ms >= TRACE_SLOW_MS:
+        slow_traces.append(trace.to_dict(total_ms))
+
+
+def _span(name):
+    """Context manager timing ``name`` in the current thread's trace (no-op when tracing is off)."""
+    if not TRACE_ENABLED:
+        return _NULL_SPAN
+    trace = getattr(_trace_local, 'trace', None)
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+class _TracedLock:
+    """threading.Lock that adds its acquisition wait to the current trace and to lifetime totals."""
+
+    __slots__ = ('_lock', 'wait_total', 'acquisitions')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wait_total = 0.0   # updated while holding the lock
+        self.acquisitions = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        t0 = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        waited = time.perf_counter() - t0
+        if acquired:
+            self.wait_total += waited
+            self.acquisitions += 1
+        trace = getattr(_trace_local, 'trace', None)
+        if trace is not None:
+            trace.lock_wait += waited
+            trace.lock_acquisitions += 1
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+@app.before_request
+def _start_request_trace():
+    if TRACE_ENABLED:
+        _begin_trace(f'{request.method} {request.path}')
+
+
+@app.teardown_request
+def _finish_request_trace(exc=None):
+    if TRACE_ENABLED:
+        _end_trace(getattr(_trace_local, 'trace', None))
+
+
+def _thread_cpu_ns(tid):
+    """CPU time used so far by thread tid (a threading ident), or None where per-thread clocks are unavailable."""
+    try:
+        return time.clock_gettime_ns(time.pthread_getcpuclockid(tid))
+    except (AttributeError, OSError, OverflowError):
+        return None
+
+
+def _sample_stacks(seconds, interval, cpu=True):
+    """Sample the stacks of all other threads; return Counter of collapsed stacks.
+
+    cpu=True weights each sample by the CPU microseconds the thread used since the previous
+    sample, so idle, sleeping and lock-waiting threads drop out; cpu=False (or no per-thread
+    CPU clocks) counts wall-clock samples.
+    """
+    counts = Counter()
+    me = threading.get_ident()
+    last_cpu = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            weight = 1
+            if cpu:
+                now_ns = _thread_cpu_ns(tid)
+                if now_ns is not None:
+                    prev_ns = last_cpu.get(tid)
+                    last_cpu[tid] = now_ns
+                    weight = 0 if prev_ns is None else (now_ns - prev_ns) // 1000
+                    if weight <= 0:
+                        continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            counts[';'.join(reversed(stack))] += weight
+        time.sleep(interval)
+    return counts
+
 
 def _validate_path(video_path):
     """Validate that video_path is within MEDIA_ROOT. Return (is_valid, absolute_path)."""
     if not video_path:
         return False, None
+    with _span('validate_path'):
+        return _resolve_media_path(video_path)
+
+
+def _resolve_media_path(video_path):
     try:
         # Expand user (~) then resolve to absolute path and check it's within MEDIA_ROOT
         expanded = os.path.expanduser(video_path)
@@ -59,27 +421,110 @@ def handle_options():
 
 
 # Session and state management (per-session playback state)
-session_lock = threading.Lock()
-sessions = {}  # session_id -> play_state dict
+class PlaybackSession:
+    """Per-session playback state.
+
+    Fixed-layout record (``__slots__``): no per-instance ``__dict__``, so thousands
+    of live sessions stay small and attribute access stays cheap.
+
+    Timing is kept as the current playback *segment* on the monotonic clock: every
+    play/pause/seek/rate change closes the running segment and opens a new one at
+    the position reached so far, so the position is exact across rate changes and
+    immune to wall-clock (NTP) jumps.
+    """
+
+    __slots__ = (
+        'is_playing',
+        'playback_rate',
+        'selected_audio',
+        'selected_subtitle',
+        'created_at',
+        'segment_start',     # monotonic clock when the current segment started
+        'segment_position',  # media position (seconds) at segment_start
+        'needs_restart',     # signal generator to restart ffmpeg with new params
+        'restart_requested_at',  # monotonic clock of the pending seek (for seek-to-first-byte)
+        'paused_at',         # monotonic clock of the last play -> pause transition (None while playing or never played)
+    )
+
+    def __init__(self):
+        self.is_playing = False
+        self.playback_rate = 1.0
+        self.selected_audio = None
+        self.selected_subtitle = None
+        self.created_at = time.time()
+        self.segment_start = time.monotonic()
+        self.segment_position = 0.0
+        self.needs_restart = False
+        self.restart_requested_at = None
+        self.paused_at = None
+
+    def position(self, now=None):
+        """Media position (seconds) at monotonic time ``now``."""
+        if not self.is_playing:
+            return self.segment_position
+        if now is None:
+            now = time.monotonic()
+        return self.segment_position + (now - self.segment_start) * self.playback_rate
+
+    def rebase(self, position=None, now=None):
+        """Close the current segment and open a new one at ``position`` (default: where playback is now)."""
+        if now is None:
+            now = time.monotonic()
+        if position is None:
+            position = self.position(now)
+        self.segment_position = max(0.0, float(position))
+        self.segment_start = now
+
+    def play(self, now=None):
+        self.rebase(now=now)
+        self.is_playing = True
+        self.paused_at = None
+
+    def pause(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.rebase(now=now)
+        if self.is_playing:
+            # seeks and ffmpeg restarts rebase the segment mid-pause; paused_at stays put
+            self.paused_at = now
+        self.is_playing = False
+
+    def seek(self, position, now=None):
+        self.rebase(position, now=now)
+
+    def set_rate(self, rate, now=None):
+        self.rebase(now=now)
+        self.playback_rate = rate
+
+    def snapshot(self, now=None):
+        """Return the public state as a plain dict (call with session_lock held)."""
+        if now is None:
+            now = time.monotonic()
+        position = self.position(now)
+        return {
+            'is_playing': self.is_playing,
+            'current_time': position,
+            'playback_rate': self.playback_rate,
+            'selected_audio': self.selected_audio,
+            'selected_subtitle': self.selected_subtitle,
+            'created_at': self.created_at,
+            'segment_start': self.segment_start,
+            'segment_position': self.segment_position,
+            'needs_restart': self.needs_restart,
+            'paused_at': self.paused_at,
+            'server_time': now,
+        }
+
+
+session_lock = _TracedLock() if TRACE_ENABLED else threading.Lock()
+sessions = {}  # session_id -> PlaybackSession
 
 
 def _create_session():
     """Create a new playback session and return session_id."""
     session_id = str(uuid.uuid4())
     with session_lock:
-        sessions[session_id] = {
-            'is_playing': False,
-            'current_time': 0.0,
-            'playback_rate': 1.0,
-            'selected_audio': None,
-            'selected_subtitle': None,
-            'created_at': time.time(),
-            'stream_start_time': None,      # wall-clock when stream started (set on first play)
-            'pause_start_time': None,       # wall-clock when last pause initiated
-            'total_paused_duration': 0.0,   # accumulated pause duration (seconds)
-            'stream_initial_seek': 0.0,     # initial seek time when stream started
-            'needs_restart': False          # signal generator to restart ffmpeg with new params
-        }
+        sessions[session_id] = PlaybackSession()
     logger.info(f"Session created: {session_id}")
     return session_id
 
@@ -105,21 +550,43 @@ def _clean_old_sessions(max_age_seconds=3600):
     """Remove sessions older than max_age_seconds (cleanup old inactive sessions)."""
     current_time = time.time()
     with session_lock:
-        expired = [sid for sid, state in sessions.items() 
-                   if current_time - state.get('created_at', current_time) > max_age_seconds]
+        expired = [sid for sid, state in sessions.items()
+                   if current_time - state.created_at > max_age_seconds]
         for sid in expired:
             del sessions[sid]
         if expired:
             logger.info(f"Cleaned {len(expired)} expired sessions")
 
 
+def _add_position_fields(response_state):
+    """Add the derived position fields of a /status payload to a snapshot dict."""
+    response_state['computed_current_time'] = response_state['current_time']
+    response_state['playback_position'] = response_state['current_time']  # also expose as playback_position for clarity
+    if not response_state['is_playing'] and response_state['paused_at'] is not None:
+        response_state['pause_elapsed'] = response_state['server_time'] - response_state['paused_at']
+    return response_state
+
+
+def _status_snapshot(session_state, now=None):
+    """Build the /status payload from a locked snapshot, including the computed position.
+
+    ``server_time`` is the server's monotonic clock at which the position was computed;
+    combined with the offset from /clock, clients can extrapolate the position locally.
+    """
+    with session_lock:
+        response_state = session_state.snapshot(now)
+    return _add_position_fields(response_state)
+
+
 def _run_ffprobe(video_path):
     """Return ffprobe JSON output for the file, or None on error."""
+    started = time.perf_counter()
     try:
         cmd = [
             'ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', video_path
         ]
-        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, timeout=10)
+        with _span('ffprobe'):
+            out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, timeout=10)
         return json.loads(out)
     except subprocess.TimeoutExpired:
         logger.warning(f"ffprobe timeout for file: {video_path}")
@@ -133,6 +600,8 @@ def _run_ffprobe(video_path):
     except Exception as e:
         logger.error(f"ffprobe unexpected error for file {video_path}: {e}")
         return None
+    finally:
+        FFPROBE_DURATION.observe(time.perf_counter() - started)
 
 
 def _is_supported_extension(path):
@@ -144,6 +613,25 @@ def _is_supported_extension(path):
         return False
 
 
+def _first_codecs(streams):
+    """Return (video_codec, audio_codec) of the first video and audio streams in ffprobe output."""
+    video_codec = None
+    audio_codec = None
+    for s in streams:
+        if s.get('codec_type') == 'video' and video_codec is None:
+            video_codec = s.get('codec_name')
+        if s.get('codec_type') == 'audio' and audio_codec is None:
+            audio_codec = s.get('codec_name')
+    return video_codec, audio_codec
+
+
+def _is_browser_compatible(video_codec, audio_codec):
+    """True when the streams can be remuxed (copy mode) instead of transcoded for the browser."""
+    if not (video_codec and audio_codec):
+        return False
+    return video_codec.lower() in ('h264', 'mpeg4') and audio_codec.lower() in ('aac', 'mp3')
+
+
 def discover_tracks(video_path):
     """Discover audio and subtitle tracks using ffprobe. Returns dict.
 
@@ -152,7 +640,11 @@ def discover_tracks(video_path):
     
     If ffprobe unavailable or parsing fails, fall back to a single audio track.
     """
-    info = _run_ffprobe(video_path)
+    return _tracks_from_probe(_run_ffprobe(video_path))
+
+
+def _tracks_from_probe(info):
+    """Build the discover_tracks result from ffprobe JSON output (or None)."""
     audio_tracks = []
     subtitle_tracks = []
     audio_idx = 0
@@ -209,6 +701,192 @@ def discover_tracks(video_path):
 
 
 
+# Media library catalog (SQLite): ffprobe results for supported files under MEDIA_ROOT.
+# Rescans are incremental (only new files or files whose size/mtime changed are probed)
+# and /tracks answers from an in-memory mirror of the catalog after a stat() check.
+LIBRARY_DB = os.getenv('LIBRARY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'library.sqlite3'))
+LIBRARY_SCAN_WORKERS = int(os.getenv('LIBRARY_SCAN_WORKERS', str(min(8, os.cpu_count() or 2))))
+
+library_lock = threading.Lock()
+_library_conn = None
+_library_cache = {}  # abs path -> _LibraryEntry
+_LibraryEntry = namedtuple('_LibraryEntry', 'size mtime_ns probe_ok tracks video_codec audio_codec')
+library_scan_state = {'running': False, 'root': None, 'started_at': None, 'finished_at': None,
+                      'files': 0, 'probed': 0, 'removed': 0, 'errors': 0}
+
+_LIBRARY_SORT_COLUMNS = {'path': 'path', 'duration': 'duration', 'mtime': 'mtime_ns', 'size': 'size'}
+
+
+def _library_db():
+    """Return the catalog connection, creating the schema and loading the cache on first use (call with library_lock held)."""
+    global _library_conn
+    if _library_conn is None:
+        conn = sqlite3.connect(LIBRARY_DB, check_same_thread=False)
+        try:
+            _library_init(conn)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        _library_conn = conn
+    return _library_conn
+
+
+def _library_init(conn):
+    """Create the schema and load the in-memory mirror of the catalog."""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS media (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        duration REAL,
+        video_codec TEXT,
+        audio_codec TEXT,
+        browser_compatible INTEGER NOT NULL,
+        audio_count INTEGER NOT NULL,
+        subtitle_count INTEGER NOT NULL,
+        probe_ok INTEGER NOT NULL,
+        tracks TEXT NOT NULL,
+        scanned_at REAL NOT NULL
+    )''')
+    for path, size, mtime_ns, probe_ok, tracks_json, vcodec, acodec in conn.execute(
+            'SELECT path, size, mtime_ns, probe_ok, tracks, video_codec, audio_codec FROM media'):
+        _library_cache[path] = _LibraryEntry(size, mtime_ns, bool(probe_ok), json.loads(tracks_json), vcodec, acodec)
+
+
+def _probe_library_entry(path, st):
+    """Run ffprobe on one file and return its catalog row."""
+    info = _run_ffprobe(path)
+    tracks_info = _tracks_from_probe(info)
+    video_codec, audio_codec = _first_codecs((info or {}).get('streams', []))
+    return (path, st.st_size, st.st_mtime_ns, tracks_info['duration'], video_codec, audio_codec,
+            int(_is_browser_compatible(video_codec, audio_codec)), len(tracks_info['audio']),
+            len(tracks_info['subtitles']), int(info is not None), json.dumps(tracks_info), time.time())
+
+
+def _entry_from_row(row):
+    return _LibraryEntry(row[1], row[2], bool(row[9]), json.loads(row[10]), row[4], row[5])
+
+
+def _library_upsert(rows):
+    with library_lock:
+        conn = _library_db()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        for row in rows:
+            _library_cache[row[0]] = _entry_from_row(row)
+
+
+def _library_remove(paths):
+    with library_lock:
+        conn = _library_db()
+        with conn:
+            conn.executemany('DELETE FROM media WHERE path = ?', [(p,) for p in paths])
+        for p in paths:
+            _library_cache.pop(p, None)
+
+
+def _library_entry(abs_path):
+    """Catalog entry for abs_path, probing (and indexing) the file on a miss, a change or a failed earlier probe.
+
+    Returns None if the file cannot be stat()ed. The catalog is only a cache: if it cannot
+    be opened or written, the file is probed directly and the result is not stored.
+    """
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return None
+    try:
+        if _library_conn is None:
+            with library_lock:
+                _library_db()
+    except sqlite3.Error as e:
+        logger.warning(f"Library catalog {LIBRARY_DB} unavailable, probing without it: {e}")
+        return _entry_from_row(_probe_library_entry(abs_path, st))
+    entry = _library_cache.get(abs_path)
+    if entry is not None and entry.probe_ok and entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+        return entry
+    logger.info(f"Discovering tracks for: {abs_path}")
+    row = _probe_library_entry(abs_path, st)
+    try:
+        _library_upsert([row])
+    except sqlite3.Error as e:
+        logger.warning(f"Could not store {abs_path} in library catalog {LIBRARY_DB}: {e}")
+    return _entry_from_row(row)
+
+
+def _library_tracks(abs_path):
+    """Tracks for abs_path from the catalog (see _library_entry)."""
+    entry = _library_entry(abs_path)
+    return entry.tracks if entry is not None else discover_tracks(abs_path)
+
+
+def _walk_media(root):
+    """Yield (path, stat) for supported, non-symlink files under root (hidden directories skipped)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.startswith('.') or not _is_supported_extension(name):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.islink(path):
+                    continue
+                yield path, os.stat(path)
+            except OSError:
+                continue
+
+
+def scan_library(root=None):
+    """Incrementally index supported files under root (default MEDIA_ROOT).
+
+    Only files that are new or whose size/mtime changed are probed, in parallel on a
+    thread pool (each probe is an ffprobe subprocess); entries for vanished files are removed.
+    Returns the scan counters, or None if a scan is already running or the catalog cannot be opened.
+    """
+    root = str(Path(root or MEDIA_ROOT).resolve())
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    with library_lock:
+        if library_scan_state['running']:
+            return None
+        try:
+            _library_db()
+        except sqlite3.Error as e:
+            logger.error(f"Library scan of {root} skipped, catalog {LIBRARY_DB} unavailable: {e}")
+            return None
+        library_scan_state.update(running=True, root=root, started_at=time.time(), finished_at=None,
+                                  files=0, probed=0, removed=0, errors=0)
+        # failed probes are never up to date: they are retried on every scan
+        known = {p: (e.size, e.mtime_ns, e.probe_ok) for p, e in _library_cache.items() if p.startswith(prefix)}
+    try:
+        seen = dict(_walk_media(root))
+        changed = [(p, st) for p, st in seen.items() if known.get(p) != (st.st_size, st.st_mtime_ns, True)]
+        removed = [p for p in known if p not in seen]
+        logger.info(f"Library scan of {root}: {len(seen)} files, {len(changed)} to probe, {len(removed)} removed")
+
+        batch = []
+        probed = errors = 0
+        with ThreadPoolExecutor(max_workers=LIBRARY_SCAN_WORKERS) as pool:
+            for row in pool.map(lambda item: _probe_library_entry(*item), changed):
+                batch.append(row)
+                probed += 1
+                errors += 0 if row[9] else 1
+                if len(batch) >= 50:
+                    _library_upsert(batch)
+                    batch = []
+                    library_scan_state.update(probed=probed, errors=errors)
+        if batch:
+            _library_upsert(batch)
+        if removed:
+            _library_remove(removed)
+        library_scan_state.update(files=len(seen), probed=probed, removed=len(removed), errors=errors,
+                                  running=False, finished_at=time.time())
+        logger.info(f"Library scan done: probed {probed} ({errors} errors), removed {len(removed)}")
+        return dict(library_scan_state)
+    finally:
+        if library_scan_state['running']:
+            library_scan_state.update(running=False, finished_at=time.time())
+
+
 @app.route('/session', methods=['POST', 'GET'])
 def session():
     """Create a new session or retrieve existing one.
@@ -228,7 +906,9 @@ def session():
         session_state = _get_session(session_id)
         if session_state:
             logger.info(f"Session verified: {session_id}")
-            return jsonify({'session_id': session_id, 'state': session_state}), 200
+            with session_lock:
+                response_state = session_state.snapshot()
+            return jsonify({'session_id': session_id, 'state': response_state}), 200
         else:
             logger.warning(f"Invalid session requested: {session_id}")
             return jsonify({'error': 'Session not found'}), 404
@@ -248,12 +928,92 @@ def tracks():
     if not _is_supported_extension(abs_path):
         logger.warning(f"Unsupported extension requested: {abs_path}")
         return jsonify({'error': 'Unsupported file type'}), 400
-    logger.info(f"Discovering tracks for: {abs_path}")
-    t = discover_tracks(abs_path)
-    logger.info(f"Found {len(t['audio'])} audio and {len(t['subtitles'])} subtitle tracks")
+    t = _library_tracks(abs_path)
+    if THUMBNAILS_ENABLED and t.get('duration'):
+        # the player loads /tracks first: start preparing seek-bar previews right away
+        try:
+            request_thumbnails(abs_path)
+        except OSError as e:
+            logger.warning(f"Could not queue thumbnails for {abs_path}: {e}")
     return jsonify(t), 200
 
 
+@app.route('/library', methods=['GET'])
+def library():
+    """Paginated, filterable listing of the media catalog.
+
+    Query params: page (default 1), page_size (default 50, max 500), q (path substring),
+    video_codec, audio_codec, compatible (true/false), sort (path|duration|mtime|size),
+    order (asc|desc), include_tracks (true to embed audio/subtitle track lists).
+    """
+    page = max(request.args.get('page', 1, type=int), 1)
+    page_size = min(max(request.args.get('page_size', 50, type=int), 1), 500)
+    sort = request.args.get('sort', 'path')
+    if sort not in _LIBRARY_SORT_COLUMNS:
+        return jsonify({'error': f"sort must be one of: {', '.join(_LIBRARY_SORT_COLUMNS)}"}), 400
+    order = 'DESC' if request.args.get('order', 'asc').lower() == 'desc' else 'ASC'
+    include_tracks = request.args.get('include_tracks', '').lower() in ('1', 'true', 'yes')
+
+    root = str(Path(MEDIA_ROOT).resolve())
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    where = ["path LIKE ? ESCAPE '\\'"]
+    params = [_like_escape(prefix) + '%']
+    q = request.args.get('q')
+    if q:
+        where.append("path LIKE ? ESCAPE '\\'")
+        params.append('%' + _like_escape(q) + '%')
+    for column in ('video_codec', 'audio_codec'):
+        value = request.args.get(column)
+        if value:
+            where.append(f'{column} = ?')
+            params.append(value)
+    compatible = request.args.get('compatible')
+    if compatible is not None:
+        where.append('browser_compatible = ?')
+        params.append(int(compatible.lower() in ('1', 'true', 'yes')))
+    where_sql = ' AND '.join(where)
+
+    try:
+        with library_lock:
+            conn = _library_db()
+            total = conn.execute(f'SELECT COUNT(*) FROM media WHERE {where_sql}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT path, size, mtime_ns, duration, video_codec, audio_codec, browser_compatible, '
+                f'audio_count, subtitle_count, probe_ok, tracks FROM media WHERE {where_sql} '
+                f'ORDER BY {_LIBRARY_SORT_COLUMNS[sort]} {order} LIMIT ? OFFSET ?',
+                params + [page_size, (page - 1) * page_size]).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Library catalog {LIBRARY_DB} unavailable: {e}")
+        return jsonify({'error': 'library catalog unavailable'}), 503
+
+    items = []
+    for path, size, mtime_ns, duration, vcodec, acodec, compat, n_audio, n_subs, probe_ok, tracks_json in rows:
+        item = {'path': path, 'size': size, 'mtime': mtime_ns / 1e9, 'duration': duration,
+                'video_codec': vcodec, 'audio_codec': acodec, 'browser_compatible': bool(compat),
+                'audio_count': n_audio, 'subtitle_count': n_subs, 'probe_ok': bool(probe_ok)}
+        if include_tracks:
+            tracks_info = json.loads(tracks_json)
+            item['audio'] = tracks_info['audio']
+            item['subtitles'] = tracks_info['subtitles']
+        items.append(item)
+    return jsonify({'total': total, 'page': page, 'page_size': page_size, 'items': items}), 200
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+@app.route('/library/scan', methods=['GET', 'POST'])
+def library_scan():
+    """POST: start an incremental background scan of MEDIA_ROOT. GET: scan progress."""
+    if request.method == 'POST':
+        if library_scan_state['running']:
+            return jsonify({'error': 'scan already running', 'state': dict(library_scan_state)}), 409
+        threading.Thread(target=scan_library, daemon=True).start()
+        return jsonify({'started': True}), 202
+    return jsonify(dict(library_scan_state)), 200
+
+
 @app.route('/select_tracks', methods=['POST'])
 def select_tracks():
     data = request.json or {}
@@ -279,10 +1039,10 @@ def select_tracks():
             
             # Update session state
             if session_state:
-                session_state['selected_audio'] = audio_index
-                session_state['selected_subtitle'] = subtitle_index
+                session_state.selected_audio = audio_index
+                session_state.selected_subtitle = subtitle_index
                 # signal streaming generator to restart ffmpeg with new mappings
-                session_state['needs_restart'] = True
+                session_state.needs_restart = True
     except Exception as e:
         logger.error(f"select_tracks error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -291,78 +1051,136 @@ def select_tracks():
     return jsonify({'ok': True, 'session_id': session_id}), 200
 
 
+def _parse_control(data):
+    """Validate a control command. Return (action, value, error); error is None when valid."""
+    action = data.get('action')
+    if not action:
+        return action, None, 'action field is required'
+    if action in ('play', 'pause'):
+        return action, None, None
+    if action == 'seek':
+        t = data.get('time')
+        if t is None:
+            return action, None, 'seek action requires time field'
+        try:
+            return action, float(t), None
+        except (ValueError, TypeError):
+            return action, None, 'time must be a number'
+    if action == 'set_rate':
+        r = data.get('rate')
+        if r is None:
+            return action, None, 'set_rate action requires rate field'
+        try:
+            rate_float = float(r)
+        except (ValueError, TypeError):
+            return action, None, 'rate must be a number'
+        if rate_float <= 0:
+            return action, None, 'rate must be positive'
+        # Constrain to supported atempo range (0.5-2.0)
+        if rate_float < 0.5 or rate_float > 2.0:
+            return action, None, f'playback rate must be between 0.5 and 2.0; requested {rate_float}x'
+        return action, rate_float, None
+    return action, None, f'unknown action: {action}'
+
+
+def _apply_control(session_id, session_state, action, value, now=None):
+    """Apply a validated control command (call with session_lock held)."""
+    if now is None:
+        now = time.monotonic()
+    if action == 'play':
+        if not session_state.is_playing and session_state.paused_at is not None:
+            pause_duration = now - session_state.paused_at
+            logger.info(f"[Session {session_id}] Resumed from pause (pause_duration: {pause_duration:.2f}s)")
+        session_state.play(now)
+        logger.info(f"[Session {session_id}] Playback started")
+    elif action == 'pause':
+        session_state.pause(now)
+        logger.info(f"[Session {session_id}] Playback paused")
+    elif action == 'seek':
+        session_state.seek(value, now)
+        # request generator to restart ffmpeg at new seek position
+        session_state.needs_restart = True
+        session_state.restart_requested_at = now
+        logger.info(f"[Session {session_id}] Seeked to {session_state.segment_position:.2f}s")
+    elif action == 'set_rate':
+        session_state.set_rate(value, now)
+        logger.info(f"[Session {session_id}] Playback rate set to {value}x")
+
+
 @app.route('/control', methods=['POST'])
 def control():
     data = request.json or {}
-    action = data.get('action')
     session_id = data.get('session_id') or request.args.get('session_id')
     
+    action, value, error = _parse_control(data)
     if not action:
-        return jsonify({'error': 'action field is required'}), 400
+        return jsonify({'error': error}), 400
     
     # Get or create session
     session_id, session_state = _get_or_create_session(session_id)
     
+    if error:
+        return jsonify({'error': error}), 400
+    
     try:
         with session_lock:
-            if action == 'play':
-                session_state['is_playing'] = True
-                # If resuming from pause, accumulate pause duration
-                if session_state['pause_start_time'] is not None:
-                    pause_duration = time.time() - session_state['pause_start_time']
-                    session_state['total_paused_duration'] += pause_duration
-                    logger.info(f"[Session {session_id}] Resumed from pause (pause_duration: {pause_duration:.2f}s)")
-                # If stream_start_time not set yet, this is the first play
-                if session_state['stream_start_time'] is None:
-                    session_state['stream_start_time'] = time.time()
-                    session_state['stream_initial_seek'] = session_state['current_time']
-                # Clear pause timer
-                session_state['pause_start_time'] = None
-                logger.info(f"[Session {session_id}] Playback started")
-            elif action == 'pause':
-                session_state['is_playing'] = False
-                # Record pause start time for duration tracking
-                session_state['pause_start_time'] = time.time()
-                logger.info(f"[Session {session_id}] Playback paused")
-            elif action == 'seek':
-                t = data.get('time')
-                if t is None:
-                    return jsonify({'error': 'seek action requires time field'}), 400
-                try:
-                    session_state['current_time'] = float(t)
-                    # Reset stream timers on seek (new stream context)
-                    session_state['stream_start_time'] = None
-                    session_state['pause_start_time'] = None
-                    session_state['total_paused_duration'] = 0.0
-                    # request generator to restart ffmpeg at new seek position
-                    session_state['needs_restart'] = True
-                    logger.info(f"[Session {session_id}] Seeked to {session_state['current_time']:.2f}s")
-                except (ValueError, TypeError):
-                    return jsonify({'error': 'time must be a number'}), 400
-            elif action == 'set_rate':
-                r = data.get('rate')
-                if r is None:
-                    return jsonify({'error': 'set_rate action requires rate field'}), 400
-                try:
-                    rate_float = float(r)
-                    if rate_float <= 0:
-                        return jsonify({'error': 'rate must be positive'}), 400
-                    # Constrain to supported atempo range (0.5-2.0)
-                    if rate_float < 0.5 or rate_float > 2.0:
-                        return jsonify({'error': f'playback rate must be between 0.5 and 2.0; requested {rate_float}x'}), 400
-                    session_state['playback_rate'] = rate_float
-                    logger.info(f"[Session {session_id}] Playback rate set to {rate_float}x")
-                except (ValueError, TypeError):
-                    return jsonify({'error': 'rate must be a number'}), 400
-            else:
-                return jsonify({'error': f'unknown action: {action}'}), 400
+            _apply_control(session_id, session_state, action, value)
+            response_state = session_state.snapshot()
         
-        return jsonify({'ok': True, 'session_id': session_id, 'state': dict(session_state)}), 200
+        return jsonify({'ok': True, 'session_id': session_id, 'state': response_state}), 200
     except Exception as e:
         logger.error(f"[Session {session_id}] control endpoint error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
+@app.route('/control_batch', methods=['POST'])
+def control_batch():
+    """Apply a list of actions to a list of sessions atomically.
+
+    Body: {"session_ids": [...], "actions": [{"action": "seek", "time": 42}, {"action": "play"}]}
+    All actions are validated first, then applied in order to every session under a
+    single lock acquisition with one shared timestamp, so all sessions resume at the
+    same instant. Nothing is applied if any action is invalid or any session is unknown.
+    """
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'request body must be a JSON object'}), 400
+    session_ids = data.get('session_ids')
+    actions = data.get('actions')
+    if not isinstance(session_ids, list) or not session_ids:
+        return jsonify({'error': 'session_ids must be a non-empty list'}), 400
+    if not all(isinstance(sid, str) and sid for sid in session_ids):
+        return jsonify({'error': 'session_ids must be non-empty strings'}), 400
+    if not isinstance(actions, list) or not actions:
+        return jsonify({'error': 'actions must be a non-empty list'}), 400
+
+    commands = []
+    for i, cmd in enumerate(actions):
+        if not isinstance(cmd, dict):
+            return jsonify({'error': f'actions[{i}] must be an object'}), 400
+        action, value, error = _parse_control(cmd)
+        if error:
+            return jsonify({'error': f'actions[{i}]: {error}'}), 400
+        commands.append((action, value))
+
+    try:
+        with session_lock:
+            targets = [(sid, sessions.get(sid)) for sid in session_ids]
+            missing = [sid for sid, state in targets if state is None]
+            if missing:
+                return jsonify({'error': 'Session not found', 'missing': missing}), 404
+            now = time.monotonic()
+            for sid, state in targets:
+                for action, value in commands:
+                    _apply_control(sid, state, action, value, now)
+            states = {sid: state.snapshot(now) for sid, state in targets}
+
+        return jsonify({'ok': True, 'server_time': now, 'states': states}), 200
+    except Exception as e:
+        logger.error(f"control_batch endpoint error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
 @app.route('/status', methods=['GET'])
 def status():
     session_id = request.args.get('session_id')
@@ -375,29 +1193,79 @@ def status():
         return jsonify({'error': 'Session not found'}), 404
     
     # Build response with computed current playback position
-    response_state = dict(session_state)
-    
-    # Compute accurate current_time based on wall-clock tracking
-    if session_state.get('stream_start_time') is not None and session_state.get('is_playing'):
-        # Stream is active and playing: calculate elapsed time
-        wall_clock_elapsed = time.time() - session_state['stream_start_time'] - session_state.get('total_paused_duration', 0.0)
-        rate = session_state.get('playback_rate', 1.0)
-        # current_time = initial_seek + elapsed_wall_clock * rate
-        computed_time = session_state['stream_initial_seek'] + (wall_clock_elapsed * rate)
-        response_state['computed_current_time'] = computed_time
-        response_state['playback_position'] = computed_time  # also expose as playback_position for clarity
-    elif session_state.get('pause_start_time') is not None:
-        # Stream was paused: accumulate the pause duration
-        pause_duration = time.time() - session_state['pause_start_time']
-        response_state['pause_elapsed'] = pause_duration
-    
-    return jsonify({'session_id': session_id, 'state': response_state}), 200
+    return jsonify({'session_id': session_id, 'state': _status_snapshot(session_state)}), 200
+
 
 
+@app.route('/status_batch', methods=['GET', 'POST'])
+def status_batch():
+    """Return the state of many sessions in one response.
 
-def _build_ffmpeg_cmd(video_path, start_time, rate, audio_idx, subtitle_idx, audio_present=True, copy_mode=False, hwaccel=None):
+    GET: session_ids=<id>,<id>,...   POST: {"session_ids": [...]}
+    All states are computed from one snapshot at the same server_time; unknown
+    session ids are listed under "missing".
+    """
+    if request.method == 'POST':
+        data = request.json or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'request body must be a JSON object'}), 400
+        session_ids = data.get('session_ids')
+    else:
+        raw = request.args.get('session_ids', '')
+        session_ids = [sid for sid in raw.split(',') if sid]
+    if not isinstance(session_ids, list) or not session_ids:
+        return jsonify({'error': 'session_ids parameter is required'}), 400
+    if not all(isinstance(sid, str) and sid for sid in session_ids):
+        return jsonify({'error': 'session_ids must be non-empty strings'}), 400
+
+    now = time.monotonic()
+    states = {}
+    missing = []
+    with session_lock:
+        for sid in session_ids:
+            session_state = sessions.get(sid)
+            if session_state is None:
+                missing.append(sid)
+            else:
+                states[sid] = session_state.snapshot(now)
+    for response_state in states.values():
+        _add_position_fields(response_state)
+
+    return jsonify({'server_time': now, 'states': states, 'missing': missing}), 200
+
+
+@app.route('/clock', methods=['GET'])
+def clock():
+    """Clock-sync probe for round-trip-compensated offset estimation (NTP-style).
+
+    Query params: client_time (optional, echoed back), session_id (optional).
+    The client records t0 before sending (passed as client_time) and t3 on receipt:
+        offset = ((server_receive_time - t0) + (server_send_time - t3)) / 2
+        rtt    = (t3 - t0) - (server_send_time - server_receive_time)
+    Server times are on the same monotonic clock as /status ``server_time``.
+    """
+    server_receive_time = time.monotonic()
+    payload = {'server_receive_time': server_receive_time, 'client_time': request.args.get('client_time', type=float)}
+    session_id = request.args.get('session_id')
+    if session_id:
+        session_state = _get_session(session_id)
+        if not session_state:
+            return jsonify({'error': 'Session not found'}), 404
+        with session_lock:
+            payload['position'] = session_state.position(server_receive_time)
+            payload['is_playing'] = session_state.is_playing
+            payload['playback_rate'] = session_state.playback_rate
+    payload['server_send_time'] = time.monotonic()
+    return jsonify(payload), 200
+
+
+
+def _build_ffmpeg_cmd(video_path, start_time, rate, audio_idx, subtitle_idx, audio_present=True, copy_mode=False, hwaccel=None, progress=False):
     # Basic command; we'll transcode video to h264 and audio to aac for browser compatibility.
     cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+    # progress: key=value lines on stderr (out_time_us=...) used to pace the encoder
+    if progress:
+        cmd += ['-nostats', '-progress', 'pipe:2']
     # seek
     if start_time and start_time > 0:
         cmd += ['-ss', str(start_time)]
@@ -460,35 +1328,131 @@ def _build_ffmpeg_cmd(video_path, start_time, rate, audio_idx, subtitle_idx, aud
 
 
 
-def generate_ffmpeg_stream(video_path, session_id, session_state):
+_PROGRESS_LINE = re.compile(r'^[a-z0-9_]+=\S*$')
+
+
+def _suspend_ffmpeg(proc, stats, stalled=False):
+    """SIGSTOP ffmpeg so it stops consuming CPU.
+
+    stalled: ffmpeg is (or may be) already blocked writing to a full pipe, so stopping it
+    saves no CPU and the time is left out of FFMPEG_SUSPENDED.
+    """
+    if stats.suspended_since is not None:
+        return
+    try:
+        proc.send_signal(signal.SIGSTOP)
+    except (ProcessLookupError, OSError):
+        return
+    stats.suspended_since = time.monotonic()
+    stats.suspended_stalled = stalled
+    logger.debug(f"[Session {stats.session_id}] ffmpeg suspended (PID: {proc.pid})")
+
+
+def _resume_ffmpeg(proc, stats):
+    """SIGCONT a suspended ffmpeg and account the time it spent stopped."""
+    if stats.suspended_since is None:
+        return
+    try:
+        proc.send_signal(signal.SIGCONT)
+    except (ProcessLookupError, OSError):
+        pass
+    suspended_for = time.monotonic() - stats.suspended_since
+    stats.suspended_since = None
+    stats.suspended_total += suspended_for
+    if not stats.suspended_stalled:
+        FFMPEG_SUSPENDED.inc(suspended_for)
+    logger.debug(f"[Session {stats.session_id}] ffmpeg resumed after {suspended_for:.2f}s (PID: {proc.pid})")
+
+
+def _pace_ffmpeg(proc, stats, start_time, rate, position, is_playing, segment_start):
+    """Suspend/resume ffmpeg so it never runs further ahead of playback than needed.
+
+    Playing: keep the encoder within FFMPEG_PACE_LEAD seconds (of playback time) of the
+    session position. Paused: suspend once the read-ahead in the stdout pipe is full, or
+    the encoder is FFMPEG_PACE_LEAD ahead; FFMPEG_PAUSE_GRACE is only a fallback for
+    platforms where the pipe fill cannot be read.
+    """
+    lead = None
+    if stats.encoded_time is not None:
+        # ffmpeg output time is in playback seconds (setpts=PTS/rate), starting at start_time
+        lead = stats.encoded_time - (position - start_time) / rate
+    if is_playing:
+        if stats.suspended_since is None:
+            if lead is not None and lead >= FFMPEG_PACE_LEAD:
+                _suspend_ffmpeg(proc, stats)
+        elif lead is None or lead <= FFMPEG_PACE_LEAD - FFMPEG_PACE_HYSTERESIS:
+            _resume_ffmpeg(proc, stats)
+    elif stats.suspended_since is None:
+        fill, capacity = _pipe_fill(proc), _pipe_capacity(proc)
+        if fill is not None and capacity:
+            # ffmpeg writes in blocks, so it stalls before the last bytes of the pipe are used
+            read_ahead_full = fill >= capacity * 3 // 4
+        else:
+            read_ahead_full = time.monotonic() - segment_start >= FFMPEG_PAUSE_GRACE
+        ahead = lead is not None and lead >= FFMPEG_PACE_LEAD
+        if read_ahead_full or ahead:
+            # unless it is still encoding ahead, ffmpeg is blocked on the pipe by now
+            _suspend_ffmpeg(proc, stats, stalled=not ahead)
+
+
+def _observe_first_output(stats, seek_requested_at, observe=True):
+    """Record stream/seek TTFB for an ffmpeg's first output (observe=False: timing unknown, skip)."""
+    now = time.monotonic()
+    if stats.first_output_at is None:
+        stats.first_output_at = now
+        if observe:
+            STREAM_TTFB.observe(now - stats.started_at)
+    if observe and seek_requested_at is not None:
+        SEEK_TTFB.observe(now - seek_requested_at)
+
+
+def _end_first_output_trace(trace, spawned, observe=True):
+    """End a stream start/restart trace with its ffmpeg_first_byte span (process spawned -> first encoded bytes).
+
+    observe=False: the time of the first output is unknown, so the span is left out.
+    """
+    if trace is None:
+        return
+    if observe:
+        trace.spans.append(('ffmpeg_first_byte', (spawned - trace.started) * 1000, (time.perf_counter() - spawned) * 1000))
+    _end_trace(trace)
+
+
+def generate_ffmpeg_stream(video_path, session_id, session_state, stats=None):
     """Generator that runs ffmpeg with current selections and yields stdout bytes.
     
     Args:
         video_path: Path to video file
-        session_state: Session state dict (REQUIRED - per-session state management)
+        session_state: PlaybackSession (REQUIRED - per-session state management)
+        stats: optional StreamStats updated with the live process, bytes sent and restarts
     
     Features:
     - Pause/resume WITHOUT interrupting connection (ffmpeg uses backpressure)
-    - Accurate playback position tracking via wall-clock time
+    - Accurate playback position tracking via monotonic-clock segments
     - Continuous streaming for reactive single-client playback
     """
     logger.info(f"Starting stream for: {video_path}")
+    trace = _begin_trace(f'stream start {session_id}')
     
-    start_time = float(session_state.get('current_time', 0.0))
-    rate = float(session_state.get('playback_rate', 1.0))
-    audio_idx = session_state.get('selected_audio')
-    subtitle_idx = session_state.get('selected_subtitle')
+    with session_lock:
+        start_time = session_state.position()
+    rate = float(session_state.playback_rate)
+    audio_idx = session_state.selected_audio
+    subtitle_idx = session_state.selected_subtitle
 
     # Ensure file exists
     if not os.path.exists(video_path):
         logger.error(f"File not found: {video_path}")
         return
 
-    # Use ffprobe to validate available streams so we don't pass invalid map indexes to ffmpeg
-    info = _run_ffprobe(video_path) or {}
-    streams = info.get('streams', [])
-    audio_count = sum(1 for s in streams if s.get('codec_type') == 'audio')
-    # subtitle_count = sum(1 for s in streams if s.get('codec_type') == 'subtitle')
+    # Validate available streams so we don't pass invalid map indexes to ffmpeg
+    # (from the library catalog; ffprobe only runs on a miss or a changed file)
+    entry = _library_entry(video_path)
+    if entry is not None and entry.probe_ok:
+        audio_count = len(entry.tracks['audio'])
+        video_codec, audio_codec = entry.video_codec, entry.audio_codec
+    else:
+        audio_count, video_codec, audio_codec = 0, None, None
 
     # Validate audio index: if out of range, fallback to default (None) or mark no-audio
     audio_present = audio_count > 0
@@ -507,83 +1471,131 @@ def generate_ffmpeg_stream(video_path, session_id, session_state):
     # We'll run ffmpeg in a loop so we can restart it on-demand (e.g. track change or seek)
     proc = None
     stderr_thread = None
+    if stats is None:
+        stats = StreamStats(session_id)
+    seek_requested_at = None
 
     while True:
         # Determine whether we can stream by remuxing (copy) instead of re-encoding to reduce latency.
-        video_codec = None
-        audio_codec = None
-        for s in streams:
-            if s.get('codec_type') == 'video' and video_codec is None:
-                video_codec = s.get('codec_name')
-            if s.get('codec_type') == 'audio' and audio_codec is None:
-                audio_codec = s.get('codec_name')
-
         # copy_mode only when codecs are already compatible and no rate change requested
-        copy_mode = False
-        if video_codec and audio_codec and rate == 1.0:
-            if video_codec.lower() in ('h264', 'mpeg4') and audio_codec.lower() in ('aac', 'mp3'):
-                copy_mode = True
+        copy_mode = rate == 1.0 and _is_browser_compatible(video_codec, audio_codec)
 
         # optional hwaccel from env
         hwaccel = os.getenv('FFMPEG_HWACCEL')
 
-        cmd = _build_ffmpeg_cmd(video_path, start_time, rate, audio_idx, subtitle_idx, audio_present=audio_present, copy_mode=copy_mode, hwaccel=hwaccel)
+        cmd = _build_ffmpeg_cmd(video_path, start_time, rate, audio_idx, subtitle_idx, audio_present=audio_present, copy_mode=copy_mode, hwaccel=hwaccel, progress=PACING_ENABLED)
         logger.debug(f"ffmpeg command: {' '.join(cmd)}")
 
         try:
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with _span('ffmpeg_spawn'):
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             logger.info(f"ffmpeg process started (PID: {proc.pid})")
         except FileNotFoundError:
             logger.error("ffmpeg executable not found; ensure ffmpeg is installed and in PATH")
+            FFMPEG_FAILURES.inc()
             return
         except Exception as e:
             logger.error(f"Failed to start ffmpeg: {e}")
+            FFMPEG_FAILURES.inc()
             return
+        spawned = time.perf_counter()
+        FFMPEG_SPAWNS.inc(label_value='stream')
+        STREAM_MODE.inc(label_value='copy' if copy_mode else 'transcode')
+        stats.proc = proc
+        stats.encoded_time = None
+        output_pending = True  # this ffmpeg has not produced output yet
+        paused_before_output = False
 
         # start thread to drain stderr so buffers don't block and we can log ffmpeg messages
-        def _drain_ffmpeg_stderr(p, sid):
+        def _drain_ffmpeg_stderr(p, sid, st):
             try:
                 for line in iter(p.stderr.readline, b''):
                     if not line:
                         break
                     try:
-                        logger.warning(f"[Session {sid}] ffmpeg: {line.decode(errors='ignore').strip()}")
+                        text = line.decode(errors='ignore').strip()
+                        if _PROGRESS_LINE.match(text):
+                            # -progress output: track encoder position, don't log
+                            if text.startswith('out_time_us='):
+                                try:
+                                    st.encoded_time = int(text[len('out_time_us='):]) / 1_000_000
+                                except ValueError:
+                                    pass
+                            continue
+                        logger.warning(f"[Session {sid}] ffmpeg: {text}")
                     except Exception:
                         logger.warning(f"[Session {sid}] ffmpeg (raw): {line}")
             except Exception as e:
                 logger.debug(f"stderr drain thread ended: {e}")
 
-        stderr_thread = threading.Thread(target=_drain_ffmpeg_stderr, args=(proc, session_id), daemon=True)
+        stderr_thread = threading.Thread(target=_drain_ffmpeg_stderr, args=(proc, session_id, stats), daemon=True)
         stderr_thread.start()
 
         try:
-            # mark stream_start_time for accurate position calculations
+            # re-anchor the playback segment on ffmpeg's actual start position
             with session_lock:
-                session_state['stream_start_time'] = time.time()
-                session_state['stream_initial_seek'] = start_time
+                session_state.rebase(start_time)
 
             while True:
                 with session_lock:
-                    is_playing = session_state.get('is_playing', False)
-                    needs_restart = session_state.get('needs_restart', False)
+                    is_playing = session_state.is_playing
+                    needs_restart = session_state.needs_restart
+                    position = session_state.position()
+                    segment_start = session_state.segment_start
 
                 if needs_restart:
                     logger.info(f"[Session {session_id}] Restart requested for ffmpeg process")
+                    # a restart before the first output (e.g. the player's initial seek) ends the
+                    # pending trace instead of dropping it with its catalog and spawn spans
+                    _end_trace(trace)
+                    trace = _begin_trace(f'stream restart {session_id}')
                     # clear flag
                     with session_lock:
-                        session_state['needs_restart'] = False
-                        # update start_time from session state current_time
-                        start_time = float(session_state.get('current_time', start_time))
+                        session_state.needs_restart = False
+                        # restart from the current position (the seek target after a seek)
+                        start_time = session_state.position()
+                        seek_requested_at = session_state.restart_requested_at
+                        session_state.restart_requested_at = None
+                    FFMPEG_RESTARTS.inc()
+                    stats.restarts += 1
                     break  # break to restart ffmpeg with updated params
 
-                if not is_playing:
+                if output_pending:
+                    # first output is taken from the pipe, not from the client's reads:
+                    # a seek while paused must not count the pause as ffmpeg latency
+                    if _pipe_fill(proc):
+                        output_pending = False
+                        _observe_first_output(stats, seek_requested_at)
+                        seek_requested_at = None
+                        _end_first_output_trace(trace, spawned)
+                        trace = None
+                    elif not is_playing:
+                        paused_before_output = True
+
+                if PACING_ENABLED:
+                    _pace_ffmpeg(proc, stats, start_time, rate, position, is_playing, segment_start)
+
+                # paused, or encoder suspended for being too far ahead: don't block on the pipe
+                if not is_playing or stats.suspended_since is not None:
                     time.sleep(0.05)
                     continue
 
                 chunk = proc.stdout.read(8192)
                 if not chunk:
                     logger.info(f"ffmpeg EOF reached (PID: {proc.pid})")
+                    if proc.wait() != 0:
+                        FFMPEG_FAILURES.inc()
                     return
+                if output_pending:
+                    # pipe fill unreadable: the read is the first sign of output, but it
+                    # only happened once playback resumed if the session was paused
+                    output_pending = False
+                    _observe_first_output(stats, seek_requested_at, observe=not paused_before_output)
+                    seek_requested_at = None
+                    _end_first_output_trace(trace, spawned, observe=not paused_before_output)
+                    trace = None
+                stats.bytes_sent += len(chunk)
+                BYTES_STREAMED.inc(len(chunk))
                 yield chunk
 
         except GeneratorExit:
@@ -592,18 +1604,22 @@ def generate_ffmpeg_stream(video_path, session_id, session_state):
             break
         except Exception as e:
             logger.error(f"Error during streaming (PID: {proc.pid}): {e}")
+            FFMPEG_FAILURES.inc()
             break
         finally:
             # cleanup current ffmpeg process before possibly restarting
             if proc:
                 try:
-                    proc.terminate()
-                    try:
-                        proc.wait(timeout=5)
-                    except subprocess.TimeoutExpired:
-                        logger.warning(f"ffmpeg process did not terminate in time, killing (PID: {proc.pid})")
-                        proc.kill()
-                        proc.wait()
+                    with _span('ffmpeg_teardown'):
+                        # a stopped process would not act on SIGTERM until continued
+                        _resume_ffmpeg(proc, stats)
+                        proc.terminate()
+                        try:
+                            proc.wait(timeout=5)
+                        except subprocess.TimeoutExpired:
+                            logger.warning(f"ffmpeg process did not terminate in time, killing (PID: {proc.pid})")
+                            proc.kill()
+                            proc.wait()
                 except Exception as e:
                     logger.warning(f"Error terminating ffmpeg process (PID: {proc.pid}): {e}")
             if stderr_thread and stderr_thread.is_alive():
@@ -613,22 +1629,31 @@ def generate_ffmpeg_stream(video_path, session_id, session_state):
                         proc.stderr.close()
                 except Exception:
                     pass
-            logger.info(f"Stream ended (PID: {proc.pid if proc else 'unknown'})")
+            stats.proc = None
+            logger.info(f"Stream ended (PID: {proc.pid if proc else 'unknown'}, ffmpeg suspended {stats.suspended_total:.1f}s in total)")
 
         # before restarting, refresh current session parameters
         with session_lock:
-            rate = float(session_state.get('playback_rate', rate))
-            audio_idx = session_state.get('selected_audio')
-            subtitle_idx = session_state.get('selected_subtitle')
-            # recompute whether audio is present
-            info = _run_ffprobe(video_path) or {}
-            streams = info.get('streams', [])
-            audio_count = sum(1 for s in streams if s.get('codec_type') == 'audio')
-            audio_present = audio_count > 0
+            rate = float(session_state.playback_rate)
+            audio_idx = session_state.selected_audio
+            subtitle_idx = session_state.selected_subtitle
+        # the file's streams were probed once above; no need to re-run ffprobe per restart
 
         # loop will recreate ffmpeg with updated start_time, rate, audio_idx
 
 
+def _tracked_ffmpeg_stream(video_path, session_id, session_state, stats):
+    """Wrap generate_ffmpeg_stream, registering the stream in live_streams while it runs."""
+    stream_id = uuid.uuid4().hex
+    with metrics_lock:
+        live_streams[stream_id] = stats
+    try:
+        yield from generate_ffmpeg_stream(video_path, session_id, session_state, stats)
+    finally:
+        with metrics_lock:
+            live_streams.pop(stream_id, None)
+
+
 
 @app.route('/stream', methods=['GET'])
 def stream():
@@ -656,7 +1681,9 @@ def stream():
     logger.info(f"[Session {session_id}] Streaming requested for: {abs_path}")
     
     # Note: we stream as MP4 bytes produced by ffmpeg; browser must handle progressive mp4
-    return Response(generate_ffmpeg_stream(abs_path, session_id, session_state), mimetype='video/mp4')
+    # created here, not in the generator, so the stream TTFB clock starts at request arrival
+    stats = StreamStats(session_id)
+    return Response(_tracked_ffmpeg_stream(abs_path, session_id, session_state, stats), mimetype='video/mp4')
 
 
 @app.route('/subtitle', methods=['GET'])
@@ -685,10 +1712,8 @@ def subtitle():
     except Exception:
         return jsonify({'error': 'idx must be a non-negative integer'}), 400
 
-    # probe to ensure subtitle stream exists
-    info = _run_ffprobe(abs_path) or {}
-    streams = info.get('streams', [])
-    subtitle_count = sum(1 for s in streams if s.get('codec_type') == 'subtitle')
+    # ensure the subtitle stream exists (answered from the library catalog when indexed)
+    subtitle_count = len(_library_tracks(abs_path)['subtitles'])
     if idx_i >= subtitle_count:
         return jsonify({'error': 'subtitle index out of range'}), 400
 
@@ -700,8 +1725,10 @@ def subtitle():
             proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         except FileNotFoundError:
             logger.error('ffmpeg not found for subtitle extraction')
+            FFMPEG_FAILURES.inc()
             yield b''
             return
+        FFMPEG_SPAWNS.inc(label_value='subtitle')
         # drain stderr in thread to avoid blocking
         def _drain_err(p):
             try:
@@ -731,9 +1758,320 @@ def subtitle():
     return Response(generate(), mimetype='text/vtt')
 
 
+# Trickplay thumbnails: sprite sheets for seek-bar previews, generated in the background
+# (one low-priority decode pass per file) and cached on disk per file identity.
+THUMBNAILS_ENABLED = os.getenv('THUMBNAILS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+THUMBNAIL_CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails'))
+THUMBNAIL_INTERVAL = float(os.getenv('THUMBNAIL_INTERVAL', '10'))  # seconds between thumbnails
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', '160'))
+THUMBNAIL_COLUMNS = int(os.getenv('THUMBNAIL_COLUMNS', '10'))
+THUMBNAIL_ROWS = int(os.getenv('THUMBNAIL_ROWS', '10'))
+THUMBNAIL_THREADS = int(os.getenv('THUMBNAIL_THREADS', '1'))  # ffmpeg decoder/encoder threads per job
+THUMBNAIL_NICE = int(os.getenv('THUMBNAIL_NICE', '19'))
+THUMBNAIL_MAX_LIVE_STREAMS = int(os.getenv('THUMBNAIL_MAX_LIVE_STREAMS', '4'))  # suspend jobs above this (0 = never)
+THUMBNAIL_RETRY_AFTER = float(os.getenv('THUMBNAIL_RETRY_AFTER', '300'))  # seconds before a failed job is retried
+
+thumbnail_lock = threading.Lock()
+thumbnail_jobs = {}  # cache key -> {'path', 'status', 'error', 'failed_at'}; queued, running or failed jobs only
+thumbnail_queue = queue.Queue()
+_thumbnail_worker = None
+
+
+def _thumbnail_key(abs_path, st):
+    """Cache key for a file identity (path, size, mtime) and the current sprite layout."""
+    ident = (f'{abs_path}\0{st.st_size}\0{st.st_mtime_ns}\0{THUMBNAIL_INTERVAL}\0'
+             f'{THUMBNAIL_WIDTH}\0{THUMBNAIL_COLUMNS}x{THUMBNAIL_ROWS}')
+    return hashlib.sha1(ident.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def _load_thumbnail_index(key):
+    try:
+        with open(os.path.join(THUMBNAIL_CACHE_DIR, key, 'index.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _thumbnail_cmd(abs_path, out_pattern, height):
+    # -skip_frame nokey decodes keyframes only: previews snap to the nearest keyframe,
+    # which is plenty for scrubbing and much cheaper than decoding every frame
+    vf = (f'fps=1/{THUMBNAIL_INTERVAL:g},scale={THUMBNAIL_WIDTH}:{height},'
+          f'tile={THUMBNAIL_COLUMNS}x{THUMBNAIL_ROWS}')
+    return ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+            '-threads', str(THUMBNAIL_THREADS), '-skip_frame', 'nokey', '-i', abs_path,
+            '-map', '0:v:0', '-an', '-sn', '-dn', '-vf', vf,
+            '-threads', str(THUMBNAIL_THREADS), '-q:v', '5', '-y', out_pattern]
+
+
+def _lower_priority(pid):
+    """Drop a thumbnail job to the lowest CPU priority so live streams always win.
+
+    Set from the parent after Popen: preexec_fn is not safe in a threaded server.
+    """
+    if not hasattr(os, 'setpriority'):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, THUMBNAIL_NICE)
+    except OSError as e:
+        logger.debug(f"Could not lower priority of thumbnail ffmpeg (PID: {pid}): {e}")
+
+
+def _run_thumbnail_job(key, abs_path):
+    """Generate the sprite sheets and index for one file into THUMBNAIL_CACHE_DIR/<key>."""
+    info = _run_ffprobe(abs_path) or {}
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+    duration = _tracks_from_probe(info)['duration']
+    if video is None or not duration or not video.get('width') or not video.get('height'):
+        raise RuntimeError('no video stream or unknown duration')
+    height = max(2, int(round(THUMBNAIL_WIDTH * video['height'] / video['width'] / 2)) * 2)
+
+    final_dir = os.path.join(THUMBNAIL_CACHE_DIR, key)
+    work_dir = final_dir + '.tmp'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    cmd = _thumbnail_cmd(abs_path, os.path.join(work_dir, 'sprite_%03d.jpg'), height)
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _lower_priority(proc.pid)
+    FFMPEG_SPAWNS.inc(label_value='thumbnails')
+    stderr_chunks = []
+    drain = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    drain.start()
+    suspended = False
+    try:
+        while proc.poll() is None:
+            # stop the job entirely while the server is busy with live streams
+            if THUMBNAIL_MAX_LIVE_STREAMS > 0:
+                with metrics_lock:
+                    busy = len(live_streams) > THUMBNAIL_MAX_LIVE_STREAMS
+                if busy != suspended:
+                    proc.send_signal(signal.SIGSTOP if busy else signal.SIGCONT)
+                    suspended = busy
+            time.sleep(0.5)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        drain.join(timeout=2)
+    if proc.returncode != 0:
+        FFMPEG_FAILURES.inc()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise RuntimeError(b''.join(stderr_chunks).decode(errors='ignore').strip()[-300:] or f'ffmpeg exited {proc.returncode}')
+
+    sheets = sorted(n for n in os.listdir(work_dir) if n.startswith('sprite_'))
+    per_sheet = THUMBNAIL_COLUMNS * THUMBNAIL_ROWS
+    count = min(int(math.ceil(duration / THUMBNAIL_INTERVAL)), len(sheets) * per_sheet)
+    index = {'interval': THUMBNAIL_INTERVAL, 'width': THUMBNAIL_WIDTH, 'height': height,
+             'columns': THUMBNAIL_COLUMNS, 'rows': THUMBNAIL_ROWS, 'count': count,
+             'duration': duration, 'sheets': sheets}
+    with open(os.path.join(work_dir, 'index.json'), 'w') as f:
+        json.dump(index, f)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(work_dir, final_dir)
+    return index
+
+
+def _thumbnail_worker_loop():
+    while True:
+        key, abs_path = thumbnail_queue.get()
+        with thumbnail_lock:
+            thumbnail_jobs[key]['status'] = 'running'
+        started = time.perf_counter()
+        try:
+            index = _run_thumbnail_job(key, abs_path)
+            status, error = 'done', None
+            logger.info(f"Thumbnails for {abs_path}: {index['count']} in {len(index['sheets'])} sheets "
+                        f"({time.perf_counter() - started:.1f}s)")
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logger.warning(f"Thumbnail generation failed for {abs_path}: {e}")
+        with thumbnail_lock:
+            if status == 'done':
+                # the on-disk index is the record of a finished job
+                thumbnail_jobs.pop(key, None)
+            else:
+                thumbnail_jobs[key].update(status=status, error=error, failed_at=time.monotonic())
+
+
+def request_thumbnails(abs_path):
+    """Return (key, index) when sprites are cached, else queue a job and return (key, job state)."""
+    st = os.stat(abs_path)
+    key = _thumbnail_key(abs_path, st)
+    index = _load_thumbnail_index(key)
+    if index is not None:
+        return key, index
+    global _thumbnail_worker
+    now = time.monotonic()
+    with thumbnail_lock:
+        # forget failures once their backoff has expired: the next request retries them
+        for k in [k for k, j in thumbnail_jobs.items()
+                  if j['status'] == 'failed' and now - j['failed_at'] >= THUMBNAIL_RETRY_AFTER]:
+            del thumbnail_jobs[k]
+        job = thumbnail_jobs.get(key)
+        if job is None:
+            job = thumbnail_jobs[key] = {'path': abs_path, 'status': 'queued', 'error': None, 'failed_at': None}
+            thumbnail_queue.put((key, abs_path))
+        if _thumbnail_worker is None:
+            # a single worker: thumbnail jobs never run concurrently
+            _thumbnail_worker = threading.Thread(target=_thumbnail_worker_loop, daemon=True)
+            _thumbnail_worker.start()
+        return key, dict(job)
+
+
+@app.route('/thumbnails', methods=['GET'])
+def thumbnails():
+    """Trickplay sprite index for a file; queues background generation on first request.
+
+    Query params: path, format (json, default, or vtt).
+    Returns 202 with the job status while sprites are being generated.
+    """
+    video_path = request.args.get('path')
+    if not video_path:
+        return jsonify({'error': "'path' parameter is required"}), 400
+    is_valid, abs_path = _validate_path(video_path)
+    if not is_valid:
+        return jsonify({'error': 'Video not found or access denied'}), 404
+    if not _is_supported_extension(abs_path):
+        logger.warning(f"Unsupported extension requested for thumbnails: {abs_path}")
+        return jsonify({'error': 'Unsupported file type'}), 400
+    if not THUMBNAILS_ENABLED:
+        return jsonify({'error': 'thumbnails are disabled'}), 404
+
+    key, index = request_thumbnails(abs_path)
+    if 'sheets' not in index:
+        code = 500 if index['status'] == 'failed' else 202
+        return jsonify({'status': index['status'], 'error': index['error']}), code
+
+    sheet_urls = [f'/thumbnails/sprite/{key}/{name}' for name in index['sheets']]
+    if request.args.get('format') != 'vtt':
+        return jsonify(dict(index, status='ready', sheets=sheet_urls)), 200
+
+    per_sheet = index['columns'] * index['rows']
+    w, h, interval = index['width'], index['height'], index['interval']
+    lines = ['WEBVTT', '']
+    for i in range(index['count']):
+        start, end = i * interval, min((i + 1) * interval, index['duration'])
+        sheet, pos = divmod(i, per_sheet)
+        row, col = divmod(pos, index['columns'])
+        lines += [f'{_vtt_time(start)} --> {_vtt_time(end)}',
+                  f'{request.host_url.rstrip("/")}{sheet_urls[sheet]}#xywh={col * w},{row * h},{w},{h}', '']
+    return Response('\n'.join(lines), mimetype='text/vtt')
+
+
+def _vtt_time(seconds):
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f'{int(h):02d}:{int(m):02d}:{s:06.3f}'
+
+
+@app.route('/thumbnails/sprite/<key>/<name>', methods=['GET'])
+def thumbnail_sprite(key, name):
+    """Serve one sprite sheet; content is immutable for a given key."""
+    if not re.fullmatch(r'[0-9a-f]{40}', key) or not re.fullmatch(r'sprite_\d{3,}\.jpg', name):
+        return jsonify({'error': 'not found'}), 404
+    path = os.path.join(THUMBNAIL_CACHE_DIR, key, name)
+    if not os.path.isfile(path):
+        return jsonify({'error': 'not found'}), 404
+    resp = send_file(path, mimetype='image/jpeg', max_age=365 * 24 * 3600)
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics."""
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+
+    with session_lock:
+        live_sessions = len(sessions)
+    with metrics_lock:
+        streams = list(live_streams.values())
+    lines += ['# HELP videostreamer_live_sessions Sessions currently held in memory.',
+              '# TYPE videostreamer_live_sessions gauge',
+              f'videostreamer_live_sessions {live_sessions}']
+    procs = [st.proc for st in streams if st.proc is not None and st.proc.poll() is None]
+    lines += ['# HELP videostreamer_ffmpeg_processes Live ffmpeg streaming processes.',
+              '# TYPE videostreamer_ffmpeg_processes gauge',
+              f'videostreamer_ffmpeg_processes {len(procs)}']
+
+    lines += ['# HELP videostreamer_stream_buffer_bytes Encoded bytes waiting in the ffmpeg stdout pipe, per live stream.',
+              '# TYPE videostreamer_stream_buffer_bytes gauge']
+    for st in streams:
+        fill = _pipe_fill(st.proc)
+        if fill is not None:
+            lines.append(f'videostreamer_stream_buffer_bytes{_format_labels({"session_id": st.session_id})} {fill}')
+    lines += ['# HELP videostreamer_stream_sent_bytes Bytes sent so far, per live stream.',
+              '# TYPE videostreamer_stream_sent_bytes gauge']
+    lines += [f'videostreamer_stream_sent_bytes{_format_labels({"session_id": st.session_id})} {st.bytes_sent}' for st in streams]
+    lines += ['# HELP videostreamer_stream_suspended Whether the stream ffmpeg is currently suspended (1) or running (0).',
+              '# TYPE videostreamer_stream_suspended gauge']
+    lines += [f'videostreamer_stream_suspended{_format_labels({"session_id": st.session_id})} {int(st.suspended_since is not None)}' for st in streams]
+    lines += ['# HELP videostreamer_stream_ffmpeg_cpu_seconds CPU time used by the current stream ffmpeg, per live stream (Linux only).',
+              '# TYPE videostreamer_stream_ffmpeg_cpu_seconds gauge']
+    for st in streams:
+        cpu = _proc_cpu_seconds(st.proc)
+        if cpu is not None:
+            lines.append(f'videostreamer_stream_ffmpeg_cpu_seconds{_format_labels({"session_id": st.session_id})} {cpu}')
+    if isinstance(session_lock, _TracedLock):
+        lines += ['# HELP videostreamer_session_lock_wait_seconds_total Time spent waiting for session_lock (STREAMER_TRACE=1 only).',
+                  '# TYPE videostreamer_session_lock_wait_seconds_total counter',
+                  f'videostreamer_session_lock_wait_seconds_total {session_lock.wait_total}',
+                  '# HELP videostreamer_session_lock_acquisitions_total session_lock acquisitions (STREAMER_TRACE=1 only).',
+                  '# TYPE videostreamer_session_lock_acquisitions_total counter',
+                  f'videostreamer_session_lock_acquisitions_total {session_lock.acquisitions}']
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        lines += ['# HELP videostreamer_child_cpu_seconds_total CPU time used by exited ffmpeg/ffprobe children (all streams; live ones are not included).',
+                  '# TYPE videostreamer_child_cpu_seconds_total counter',
+                  f'videostreamer_child_cpu_seconds_total {usage.ru_utime + usage.ru_stime}']
+    lines += ['# HELP videostreamer_stream_restarts ffmpeg restarts so far, per live stream.',
+              '# TYPE videostreamer_stream_restarts gauge']
+    lines += [f'videostreamer_stream_restarts{_format_labels({"session_id": st.session_id})} {st.restarts}' for st in streams]
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    """Recent slow traces (most recent first). Requires STREAMER_TRACE=1.
+
+    Query params: limit (default 20), min_ms (only traces at least this slow).
+    """
+    if not TRACE_ENABLED:
+        return jsonify({'error': 'tracing disabled; set STREAMER_TRACE=1'}), 404
+    limit = request.args.get('limit', 20, type=int)
+    min_ms = request.args.get('min_ms', 0.0, type=float)
+    traces = [t for t in reversed(slow_traces) if t['total_ms'] >= min_ms][:limit]
+    return jsonify({'slow_ms': TRACE_SLOW_MS, 'traces': traces}), 200
+
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Sampled stack profile of all server threads, in collapsed-stack (flamegraph) format.
+
+    Query params: seconds (default 5, max 60), interval_ms (default 5), mode (cpu, default,
+    or wall). cpu weights stacks by thread CPU microseconds; wall counts samples of every
+    thread, waiting ones included (where per-thread CPU clocks are unavailable, cpu falls
+    back to wall). Blocks the calling request for the sampling duration. Requires STREAMER_TRACE=1.
+    """
+    if not TRACE_ENABLED:
+        return jsonify({'error': 'tracing disabled; set STREAMER_TRACE=1'}), 404
+    seconds = min(max(request.args.get('seconds', 5.0, type=float), 0.1), 60.0)
+    interval = max(request.args.get('interval_ms', 5.0, type=float), 1.0) / 1000
+    mode = request.args.get('mode', 'cpu')
+    if mode not in ('cpu', 'wall'):
+        return jsonify({'error': 'mode must be cpu or wall'}), 400
+    counts = _sample_stacks(seconds, interval, cpu=mode == 'cpu')
+    body = ''.join(f'{stack} {n}\n' for stack, n in counts.most_common())
+    return Response(body, mimetype='text/plain')
+
+
 
 if __name__ == '__main__':
     # Clean up any old sessions on startup
     _clean_old_sessions(max_age_seconds=3600)
+    if os.getenv('LIBRARY_SCAN_ON_START', '').lower() in ('1', 'true', 'yes'):
+        threading.Thread(target=scan_library, daemon=True).start()
     logger.info("Starting Flask app on port 5000")
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file